@@ -0,0 +1,238 @@
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, Iterable, List
+
+from restaurant_core import write_atomic
+
+CODES_FILE = "access_codes.jsonl"
+LEGACY_CODES_FILE = "access_codes.json"
+HASH_ITERATIONS = 50_000
+INDEX_ITERATIONS = 10_000
+SALT_BYTES = 16
+CACHE_SECONDS = 8 * 3600
+MAX_FAILURES = 5
+LOCKOUT_SECONDS = 30.0
+LOCKOUT_MAX_SECONDS = 900.0
+CODE_PATTERN = re.compile(r"\d{4,8}")
+SUPER_CODE = "0000"
+SUPER_USER = "SUPER"
+
+PERM_LAYOUT = "layout.edit"
+PERM_CODES = "codes.manage"
+PERM_ALL_TABLES = "tables.all"
+PERM_DIAGNOSTICS = "diagnostics"
+PERM_REPORTS = "reports"
+PERMISSIONS = (PERM_LAYOUT, PERM_CODES, PERM_ALL_TABLES, PERM_DIAGNOSTICS, PERM_REPORTS)
+ROLE_PERMISSIONS: Dict[str, FrozenSet[str]] = {
+    "super": frozenset(PERMISSIONS),
+    "juhataja": frozenset({PERM_ALL_TABLES, PERM_REPORTS}),
+    "teenindaja": frozenset(),
+}
+
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Liiga palju valesid katseid. Proovi uuesti {retry_after:.0f} s pärast.")
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class Principal:
+    user_id: str
+    role: str
+    permissions: FrozenSet[str]
+
+    def can(self, permission: str) -> bool:
+        return permission in self.permissions
+
+
+@dataclass(frozen=True)
+class Credential:
+    user_id: str
+    role: str
+    extra: FrozenSet[str]
+    index: str
+    salt: bytes
+    digest: bytes
+
+    def principal(self) -> Principal:
+        return Principal(self.user_id, self.role, ROLE_PERMISSIONS.get(self.role, frozenset()) | self.extra)
+
+
+def append_synced(path: Path, text: str):
+    with path.open("a", encoding="utf-8") as handle:
+        handle.write(text)
+        handle.flush()
+        os.fsync(handle.fileno())
+
+
+class CredentialStore:
+    def __init__(self, path: Path = Path(CODES_FILE), legacy_path: Path | None = Path(LEGACY_CODES_FILE), writer: Callable[[Path, str], None] | None = None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.writer = writer or append_synced
+        self.index_salt = b""
+        self.iterations = HASH_ITERATIONS
+        self.index_iterations = INDEX_ITERATIONS
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.locked_until = 0.0
+        self._by_index: Dict[str, Credential] = {}
+        self._by_user: Dict[str, Credential] = {}
+        self._cache: Dict[bytes, tuple[Principal, float]] = {}
+        self._cache_key = secrets.token_bytes(32)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._by_user)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id.strip() in self._by_user
+
+    def users(self) -> List[Principal]:
+        return [self._by_user[user_id].principal() for user_id in sorted(self._by_user)]
+
+    def open(self) -> "CredentialStore":
+        text = self.path.read_text(encoding="utf-8") if self.path.exists() else ""
+        for line in text.splitlines():
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                continue
+        if self.index_salt:
+            return self
+        if text.strip():
+            raise ValueError(f"{self.path} on vigane (init-kirje puudub); faili ei muudetud.")
+        self.index_salt = secrets.token_bytes(SALT_BYTES)
+        header = {"op": "init", "index_salt": self.index_salt.hex(), "iterations": self.iterations, "index_iterations": self.index_iterations}
+        records = [header, self._record(SUPER_CODE, SUPER_USER, "super", ())]
+        legacy = self._legacy_codes()
+        for number, code in enumerate(legacy or [], 1):
+            records.append(self._record(code, f"teenindaja-{number}", "teenindaja", ()))
+        write_atomic(self.path, "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+        for record in records[1:]:
+            self._apply(record)
+        if legacy is not None:
+            self.legacy_path.unlink()
+        return self
+
+    def _legacy_codes(self) -> List[str] | None:
+        if self.legacy_path is None or not self.legacy_path.exists():
+            return None
+        try:
+            raw = json.loads(self.legacy_path.read_text(encoding="utf-8"))
+        except ValueError:
+            return None
+        codes = {code.strip() for code in raw.get("codes", []) if isinstance(code, str) and CODE_PATTERN.fullmatch(code.strip())}
+        return sorted(codes - {SUPER_CODE})
+
+    def _apply(self, record: Dict):
+        op = record["op"]
+        if op == "init":
+            self.index_salt = bytes.fromhex(record["index_salt"])
+            self.iterations = int(record["iterations"])
+            self.index_iterations = int(record["index_iterations"])
+        elif op == "add":
+            credential = Credential(record["id"], record["role"], frozenset(record.get("permissions", ())), record["index"], bytes.fromhex(record["salt"]), bytes.fromhex(record["hash"]))
+            self._drop(credential.user_id)
+            self._by_user[credential.user_id] = self._by_index[credential.index] = credential
+        elif op == "remove":
+            self._drop(record["id"])
+        elif op == "fail":
+            self.failures = int(record["count"])
+            self.locked_until = time.monotonic() + max(0.0, min(LOCKOUT_MAX_SECONDS, float(record["until"]) - time.time()))
+            return
+        self._cache.clear()
+
+    def _drop(self, user_id: str):
+        previous = self._by_user.pop(user_id, None)
+        if previous is not None:
+            self._by_index.pop(previous.index, None)
+
+    def _index_of(self, code: str) -> str:
+        return hashlib.pbkdf2_hmac("sha256", code.encode("utf-8"), self.index_salt, self.index_iterations).hex()
+
+    def _hash(self, code: str, salt: bytes) -> bytes:
+        return hashlib.pbkdf2_hmac("sha256", code.encode("utf-8"), salt, self.iterations)
+
+    def _record(self, code: str, user_id: str, role: str, permissions: Iterable[str]) -> Dict:
+        salt = secrets.token_bytes(SALT_BYTES)
+        return {"op": "add", "id": user_id, "role": role, "permissions": sorted(permissions), "index": self._index_of(code), "salt": salt.hex(), "hash": self._hash(code, salt).hex()}
+
+    def _append(self, record: Dict):
+        self.writer(self.path, json.dumps(record, ensure_ascii=False) + "\n")
+        self._apply(record)
+
+    def _set_failures(self, count: int, now: float):
+        self.failures = count
+        if count >= MAX_FAILURES:
+            self.locked_until = now + min(LOCKOUT_MAX_SECONDS, LOCKOUT_SECONDS * 2 ** (count - MAX_FAILURES))
+        until = time.time() + max(0.0, self.locked_until - now)
+        self._append({"op": "fail", "count": count, "until": round(until, 3)})
+
+    def add(self, code: str, user_id: str, role: str, permissions: Iterable[str] = (), replace: bool = False) -> Principal:
+        code, user_id = code.strip(), user_id.strip()
+        if not CODE_PATTERN.fullmatch(code):
+            raise ValueError("Kood peab olema 4–8-kohaline number.")
+        if not user_id:
+            raise ValueError("Nimi on kohustuslik.")
+        if user_id in (SUPER_USER, SUPER_CODE):
+            raise ValueError(f"Nimi {user_id} on reserveeritud.")
+        if role not in ROLE_PERMISSIONS:
+            raise ValueError(f"Tundmatu roll {role!r}.")
+        unknown = set(permissions) - set(PERMISSIONS)
+        if unknown:
+            raise ValueError(f"Tundmatud õigused: {', '.join(sorted(unknown))}.")
+        with self._lock:
+            if user_id in self._by_user and not replace:
+                raise ValueError(f"Nimi {user_id} on juba kasutusel.")
+            existing = self._by_index.get(self._index_of(code))
+            if existing is not None and existing.user_id != user_id:
+                raise ValueError("See kood on juba kasutusel.")
+            self._append(self._record(code, user_id, role, permissions))
+            return self._by_user[user_id].principal()
+
+    def remove(self, user_id: str) -> bool:
+        with self._lock:
+            if user_id not in self._by_user:
+                return False
+            self._append({"op": "remove", "id": user_id})
+            return True
+
+    def verify(self, code: str) -> Principal | None:
+        code = code.strip()
+        now = time.monotonic()
+        with self._lock:
+            if now < self.locked_until:
+                raise LoginThrottled(self.locked_until - now)
+            key = hmac.new(self._cache_key, code.encode("utf-8"), hashlib.sha256).digest()
+            cached = self._cache.get(key)
+            if cached is not None and cached[1] > now:
+                self.hits += 1
+                if self.failures:
+                    self._set_failures(0, now)
+                return cached[0]
+            self.misses += 1
+            credential = self._by_index.get(self._index_of(code))
+            digest = self._hash(code, credential.salt if credential is not None else self.index_salt)
+            if credential is None or not hmac.compare_digest(digest, credential.digest):
+                self._set_failures(self.failures + 1, now)
+                return None
+            if self.failures:
+                self._set_failures(0, now)
+            principal = credential.principal()
+            self._cache[key] = (principal, now + CACHE_SECONDS)
+            return principal
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"users": len(self._by_user), "cached": len(self._cache), "hits": self.hits, "misses": self.misses, "failures": self.failures}
@@ -0,0 +1,406 @@
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from restaurant_auth import SUPER_CODE
+from restaurant_core import CoreError, OrderItem, RestaurantCore
+from restaurant_metrics import Instrumentation
+from restaurant_sales import SalesStore
+from restaurant_service_app import (
+    MIN_ZOOM,
+    MapRenderer,
+    OrderTreeView,
+    SpatialGrid,
+    SpriteCache,
+    table_bounds,
+    table_footprint,
+)
+
+DEFAULT_SIZES = (10, 100, 1000, 5000)
+DEFAULT_EVENTS = 5000
+DEFAULT_SALES_LINES = 250000
+SALES_DAYS = 30
+DEFAULT_THRESHOLD = 0.25
+MIN_REGRESSION_MS = 0.005
+VIEW_SIZE = (1280, 800)
+TABLE_PITCH = 240
+WAITER_CODES = ("1111", "2222", "3333", "4444", "5555")
+MENU = (("Supp", 450), ("Praad", 1290), ("Salat", 780), ("Kohv", 250), ("Vesi", 150), ("Kook", 520), ("Vein", 690))
+COMPARED = ("mean_ms", "p95_ms")
+
+
+class RecordingCanvas:
+    def __init__(self, width: int = VIEW_SIZE[0], height: int = VIEW_SIZE[1]):
+        self.width = width
+        self.height = height
+        self.calls: Counter = Counter()
+        self._next_id = 0
+        self._items: Dict[int, tuple] = {}
+        self._tags: Dict[str, set] = {}
+
+    def _create(self, kind: str, tags: tuple = (), **_options) -> int:
+        self.calls[kind] += 1
+        self._next_id += 1
+        self._items[self._next_id] = tags
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(self._next_id)
+        return self._next_id
+
+    def create_rectangle(self, *_coords, tags: tuple = (), **options) -> int:
+        return self._create("create_rectangle", tags, **options)
+
+    def create_oval(self, *_coords, tags: tuple = (), **options) -> int:
+        return self._create("create_oval", tags, **options)
+
+    def create_text(self, *_coords, tags: tuple = (), **options) -> int:
+        return self._create("create_text", tags, **options)
+
+    def create_image(self, *_coords, tags: tuple = (), **options) -> int:
+        return self._create("create_image", tags, **options)
+
+    def _find(self, tag_or_id) -> set:
+        if isinstance(tag_or_id, int):
+            return {tag_or_id} if tag_or_id in self._items else set()
+        return set(self._tags.get(tag_or_id, ()))
+
+    def delete(self, *tags_or_ids):
+        self.calls["delete"] += 1
+        for tag_or_id in tags_or_ids:
+            for item in self._find(tag_or_id):
+                for tag in self._items.pop(item):
+                    self._tags[tag].discard(item)
+
+    def move(self, tag_or_id, _dx: float, _dy: float):
+        self.calls["move"] += 1
+
+    def itemconfigure(self, tag_or_id, **_options):
+        self.calls["itemconfigure"] += 1
+
+    def find_all(self) -> tuple:
+        return tuple(self._items)
+
+    def winfo_width(self) -> int:
+        return self.width
+
+    def winfo_height(self) -> int:
+        return self.height
+
+
+class RecordingTree:
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self._children: Dict[str, List[str]] = {"": []}
+        self._parents: Dict[str, str] = {}
+
+    def insert(self, parent: str, _index, iid: str, **_options) -> str:
+        self.calls["insert"] += 1
+        self._children[parent].append(iid)
+        self._children[iid] = []
+        self._parents[iid] = parent
+        return iid
+
+    def item(self, iid: str, **_options):
+        self.calls["item"] += 1
+
+    def delete(self, *iids: str):
+        self.calls["delete"] += 1
+        for iid in iids:
+            self._children[self._parents.pop(iid)].remove(iid)
+            for child in self._children.pop(iid):
+                self._parents.pop(child)
+                self._children.pop(child)
+
+    def get_children(self, item: str = "") -> tuple:
+        return tuple(self._children[item])
+
+
+class RecordingImage:
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.puts = 0
+
+    def put(self, _color: str, to: tuple):
+        self.puts += 1
+
+
+def synthetic_layout(count: int, rng: random.Random) -> Dict[int, Dict]:
+    columns = max(1, math.ceil(math.sqrt(count * VIEW_SIZE[0] / VIEW_SIZE[1])))
+    layout = {}
+    for index in range(count):
+        sides = {side: rng.randint(0, 4) for side in ("up", "right", "down", "left")}
+        sides["up"] = max(1, sides["up"])
+        row, col = divmod(index, columns)
+        layout[index + 1] = {"center": {"x": TABLE_PITCH // 2 + col * TABLE_PITCH, "y": TABLE_PITCH // 2 + row * TABLE_PITCH}, "sides": sides}
+    return layout
+
+
+def generate_shift(tables: List[int], events: int, rng: random.Random) -> List[Dict]:
+    shift: List[Dict] = []
+    active: Dict[int, List[Dict]] = {}
+    idle = list(tables)
+    rng.shuffle(idle)
+    while len(shift) < events:
+        if idle and (len(active) < 4 or (len(active) < 3 * len(WAITER_CODES) and rng.random() < 0.3)):
+            table_num = idle.pop()
+            code = rng.choice(WAITER_CODES)
+            guests = [f"Külaline {n}" for n in range(1, rng.randint(1, 6) + 1)]
+            steps = [{"type": "owner", "table": table_num, "owner": code}]
+            steps += [{"type": "guest", "table": table_num, "guest": guest} for guest in guests]
+            for _ in range(rng.randint(len(guests), 4 * len(guests))):
+                name, cents = rng.choice(MENU)
+                steps.append({"type": "order", "table": table_num, "guest": rng.choice(guests), "name": name, "qty": rng.randint(1, 3), "cents": cents})
+            steps += [{"type": "paid", "table": table_num, "guest": guest, "method": rng.choice(("cash", "card"))} for guest in guests]
+            steps.reverse()
+            active[table_num] = steps
+        if not active:
+            idle = list(tables)
+            rng.shuffle(idle)
+            continue
+        table_num = rng.choice(list(active))
+        shift.append(active[table_num].pop())
+        if not active[table_num]:
+            del active[table_num]
+            idle.insert(0, table_num)
+    return shift
+
+
+def load_shift(path: Path) -> List[Dict]:
+    events = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            events.append(json.loads(line))
+    return events
+
+
+def save_shift(path: Path, events: List[Dict]):
+    path.write_text("".join(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n" for event in events), encoding="utf-8")
+
+
+def replay_event(core: RestaurantCore, event: Dict):
+    table_num = event["table"]
+    code = core.owner(table_num) or SUPER_CODE
+    kind = event["type"]
+    if kind == "guest":
+        core.add_guest(table_num, event["guest"], code, all_tables=True)
+    elif kind == "order":
+        core.add_order(table_num, OrderItem(event["guest"], event["name"], event["qty"], event["cents"], item_id=event.get("item", "")), code, all_tables=True)
+    elif kind == "paid":
+        core.pay_guest(table_num, event["guest"], event.get("method", "cash"), code, all_tables=True)
+    elif kind == "owner":
+        if event["owner"] is not None:
+            core.claim(table_num, event["owner"], all_tables=True)
+        else:
+            core.release(table_num, code, all_tables=True)
+
+
+class Benchmark:
+    def __init__(self, layout: Dict[int, Dict], shift: List[Dict], sales_lines: int = DEFAULT_SALES_LINES):
+        self.layout = layout
+        self.shift = shift
+        self.sales_lines = sales_lines
+        self.metrics = Instrumentation(enabled=True)
+        self.canvas = RecordingCanvas()
+        self.tree = RecordingTree()
+        self.core = RestaurantCore()
+        self.grid = SpatialGrid()
+        self.sprites = SpriteCache(RecordingImage)
+        self.renderer = MapRenderer(self.canvas, self._color, self.grid.query_rect, self.sprites)
+        self.orders = OrderTreeView(self.tree)
+        self.rejected = 0
+
+    def _color(self, table_num: int) -> str:
+        return "#2ea043" if self.core.is_free(table_num) else "#1f6feb"
+
+    def _timed(self, name: str, func: Callable, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.metrics.record(name, time.perf_counter() - start)
+        return result
+
+    def _index(self):
+        self.grid.clear()
+        for table_num, entry in self.layout.items():
+            self.grid.insert(table_num, table_bounds(entry))
+
+    def _draw(self):
+        self.renderer.reset()
+        self.renderer.flush()
+
+    def _step(self, dx: float, dy: float):
+        self.renderer.pan(dx, dy)
+        self.renderer.flush()
+
+    def _zoom(self, factor: float):
+        self.renderer.zoom_at(factor, self.canvas.width / 2, self.canvas.height / 2)
+        self.renderer.flush()
+
+    def _world_bounds(self) -> tuple[int, int, int, int]:
+        boxes = [table_footprint(entry) for entry in self.layout.values()] or [(0, 0, 1, 1)]
+        return min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)
+
+    def run_map(self, rng: random.Random):
+        for _ in range(5):
+            self._timed("layout_index", self._index)
+        self._timed("map_set_layout", self.renderer.set_layout, self.layout)
+        self._timed("map_first_draw", self.renderer.flush)
+        for _ in range(5):
+            self._timed("map_draw", self._draw)
+        for _ in range(200):
+            self._timed("map_pan", self._step, rng.uniform(-60, 60), rng.uniform(-60, 60))
+        for direction in [1.2] * 8 + [1 / 1.2] * 16 + [1.2] * 8:
+            self._timed("map_zoom", self._zoom, direction)
+        left, top, right, bottom = self._world_bounds()
+        fit = min(self.canvas.width / (right - left), self.canvas.height / (bottom - top))
+        self.renderer.scale = max(MIN_ZOOM, round(fit, 3))
+        self.renderer.offset_x, self.renderer.offset_y = left * self.renderer.scale, top * self.renderer.scale
+        for _ in range(3):
+            self._timed("map_overview_draw", self._draw)
+        self.metrics.gauge("overview_items", self.renderer.item_count())
+        self.renderer.scale, self.renderer.offset_x, self.renderer.offset_y = 1.0, 0.0, 0.0
+        self._draw()
+        for _ in range(2000):
+            self._timed("hit_test", self.grid.query_point, rng.uniform(left, right), rng.uniform(top, bottom))
+
+    def run_shift(self) -> float:
+        focus = None
+        start = time.perf_counter()
+        for event in self.shift:
+            table_num = event["table"]
+            try:
+                self._timed(f"shift_{event['type']}", replay_event, self.core, event)
+            except CoreError:
+                self.rejected += 1
+                continue
+            self.renderer.invalidate(table_num)
+            self._timed("map_flush", self.renderer.flush)
+            if focus is None:
+                focus = table_num
+            if table_num == focus:
+                self._timed("order_sync", self.orders.sync, self.core.table(table_num))
+                if self.core.is_free(table_num):
+                    focus = None
+        return time.perf_counter() - start
+
+    def run_sales(self, rng: random.Random):
+        store = SalesStore()
+        tables = sorted(self.layout) or [1]
+        start = time.time() - SALES_DAYS * 86400
+        step = SALES_DAYS * 86400 / max(1, self.sales_lines / 3)
+        stamp = start
+        while len(store) < self.sales_lines:
+            stamp += step
+            lines = [(name, name, rng.randint(1, 3), cents) for name, cents in rng.sample(MENU, rng.randint(1, 5))]
+            self._timed("sales_record", store.record, rng.choice(tables), rng.choice(WAITER_CODES), rng.choice(("cash", "card")), lines, stamp)
+        for _ in range(3):
+            self._timed("sales_report_month", store.report, start, stamp + 1)
+        for day in range(5):
+            self._timed("sales_report_day", store.report, start + day * 86400, start + (day + 1) * 86400)
+        self.metrics.gauge("sales_lines", len(store))
+
+    def run(self, rng: random.Random) -> Dict:
+        self.run_map(rng)
+        elapsed = self.run_shift()
+        for query in [name for name, _ in MENU] + list(WAITER_CODES) + ["külaline 1", "k"]:
+            for _ in range(20):
+                self._timed("table_search", self.core.search, query)
+        if self.sales_lines:
+            self.run_sales(rng)
+        snapshot = self.metrics.snapshot()
+        for summary in snapshot["operations"].values():
+            summary["ops_per_s"] = 1000 / summary["mean_ms"] if summary["mean_ms"] else 0.0
+        return {
+            "tables": len(self.layout),
+            "events": len(self.shift),
+            "rejected": self.rejected,
+            "shift_seconds": elapsed,
+            "events_per_s": len(self.shift) / elapsed if elapsed else 0.0,
+            "operations": snapshot["operations"],
+            "gauges": snapshot["gauges"],
+            "canvas_calls": dict(sorted(self.canvas.calls.items())),
+            "tree_calls": dict(sorted(self.tree.calls.items())),
+            "sprites": {"cached": len(self.sprites), "hits": self.sprites.hits, "misses": self.sprites.misses},
+        }
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    regressions = []
+    for scenario, result in results.items():
+        previous = baseline.get(scenario)
+        if previous is None:
+            continue
+        for name, summary in result["operations"].items():
+            old = previous["operations"].get(name)
+            if old is None:
+                continue
+            for key in COMPARED:
+                limit = old[key] * (1 + threshold)
+                if summary[key] > limit and summary[key] - old[key] > MIN_REGRESSION_MS:
+                    regressions.append(f"{scenario} {name} {key}: {summary[key]:.3f} ms > {old[key]:.3f} ms (+{(summary[key] / old[key] - 1) * 100 if old[key] else math.inf:.0f}%)")
+    return regressions
+
+
+def print_report(scenario: str, result: Dict):
+    print(f"\n== {scenario}: {result['tables']} lauda, {result['events']} sündmust ({result['rejected']} tagasi lükatud), {result['events_per_s']:.0f} sündmust/s")
+    print(f"{'operatsioon':<20}{'arv':>8}{'keskm ms':>11}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'op/s':>12}")
+    for name, s in result["operations"].items():
+        print(f"{name:<20}{s['count']:>8}{s['mean_ms']:>11.3f}{s['p50_ms']:>10.3f}{s['p95_ms']:>10.3f}{s['p99_ms']:>10.3f}{s['max_ms']:>10.3f}{s['ops_per_s']:>12.0f}")
+    print(f"lõuendi kutsed: {result['canvas_calls']}")
+    print(f"puu kutsed: {result['tree_calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lauateeninduse jõudlustest ilma kasutajaliideseta")
+    parser.add_argument("--tables", default=",".join(map(str, DEFAULT_SIZES)), help="lauaarvud komadega eraldatult")
+    parser.add_argument("--layout", help="kasuta sünteetilise asemel olemasolevat kaardifaili")
+    parser.add_argument("--events", type=int, default=DEFAULT_EVENTS, help="genereeritud vahetuse sündmuste arv")
+    parser.add_argument("--shift", help="esita salvestatud vahetus (order_journal.jsonl vormingus)")
+    parser.add_argument("--save-shift", help="salvesta genereeritud vahetus faili")
+    parser.add_argument("--sales-lines", type=int, default=DEFAULT_SALES_LINES, help="müügiaruande testi ridade arv (0 = vahele)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="kirjuta tulemused JSON-faili")
+    parser.add_argument("--baseline", help="võrdle tulemusi selle JSON-failiga")
+    parser.add_argument("--update-baseline", action="store_true", help="kirjuta tulemused --baseline faili")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="lubatud aeglustumine (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    if args.layout:
+        data = json.loads(Path(args.layout).read_text(encoding="utf-8"))
+        layouts = {Path(args.layout).stem: {int(k): v for k, v in data.get("tables", {}).items()}}
+    else:
+        layouts = {f"tables_{count}": synthetic_layout(count, random.Random(args.seed)) for count in map(int, args.tables.split(","))}
+
+    results = {}
+    for scenario, layout in layouts.items():
+        rng = random.Random(args.seed)
+        if args.shift:
+            shift = load_shift(Path(args.shift))
+        else:
+            shift = generate_shift(sorted(layout), args.events, rng)
+            if args.save_shift:
+                save_shift(Path(args.save_shift), shift)
+        results[scenario] = Benchmark(layout, shift, args.sales_lines).run(rng)
+        print_report(scenario, results[scenario])
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.baseline and args.update_baseline:
+        Path(args.baseline).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"\nBaastase salvestatud: {args.baseline}")
+    elif args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args.threshold)
+        for line in regressions:
+            print(f"REGRESSIOON {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"\nRegressioone ei leitud (lävi {args.threshold * 100:.0f}%).")
+
+
+if __name__ == "__main__":
+    main()
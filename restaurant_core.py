@@ -0,0 +1,1024 @@
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import unicodedata
+from collections import deque
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Set
+
+from restaurant_sales import SALES_FILE, SalesStore
+
+JOURNAL_FILE = "order_journal.jsonl"
+SNAPSHOT_FILE = "order_snapshot.json"
+JOURNAL_SYNC_BATCH = 64
+JOURNAL_SYNC_SECONDS = 0.5
+JOURNAL_COMPACT_EVENTS = 20000
+RECENT_EVENTS = 10000
+AUTOSAVE_DELAY = 0.25
+TABLE_FREE = "free"
+TABLE_CLAIMED = "claimed"
+TABLE_OPEN = "open"
+TABLE_SETTLED = "settled"
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+
+
+def to_cents(value: float | str) -> int:
+    return int((Decimal(str(value)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def search_key(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return " ".join("".join(ch for ch in decomposed if not unicodedata.combining(ch)).split())
+
+
+@dataclass(slots=True)
+class OrderItem:
+    guest_id: str
+    name: str
+    qty: int
+    unit_cents: int
+    line_id: int = 0
+    item_id: str = ""
+
+    def __post_init__(self):
+        self.guest_id = sys.intern(self.guest_id)
+        self.name = sys.intern(self.name)
+        self.item_id = sys.intern(self.item_id)
+
+    @property
+    def merge_key(self) -> tuple[str, int, str]:
+        return self.name, self.unit_cents, self.item_id
+
+    @property
+    def unit_price(self) -> float:
+        return self.unit_cents / 100
+
+    @property
+    def total_cents(self) -> int:
+        return self.qty * self.unit_cents
+
+    @property
+    def total(self) -> float:
+        return self.total_cents / 100
+
+
+class SearchIndex:
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, Dict[int, int]]] = {}
+        self.terms: List[str] = []
+        self.present: Set[tuple[int, str]] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def clear(self):
+        with self._lock:
+            self.postings.clear()
+            self.terms.clear()
+            self.present.clear()
+
+    def _add(self, text: str, table_num: int, line_id: int):
+        for term in set(search_key(text).split()):
+            tables = self.postings.get(term)
+            if tables is None:
+                tables = self.postings[term] = {}
+                bisect.insort(self.terms, term)
+            lines = tables.setdefault(table_num, {})
+            lines[line_id] = lines.get(line_id, 0) + 1
+
+    def _remove(self, text: str, table_num: int, line_id: int):
+        for term in set(search_key(text).split()):
+            tables = self.postings.get(term)
+            lines = tables.get(table_num) if tables is not None else None
+            if lines is None or line_id not in lines:
+                continue
+            lines[line_id] -= 1
+            if not lines[line_id]:
+                del lines[line_id]
+            if not lines:
+                del tables[table_num]
+            if not tables:
+                del self.postings[term]
+                del self.terms[bisect.bisect_left(self.terms, term)]
+
+    def add_guest(self, table_num: int, guest_id: str):
+        with self._lock:
+            if (table_num, guest_id) not in self.present:
+                self.present.add((table_num, guest_id))
+                self._add(guest_id, table_num, 0)
+
+    def add_line(self, table_num: int, item: OrderItem):
+        with self._lock:
+            self._add(f"{item.guest_id} {item.name} {item.item_id}", table_num, item.line_id)
+
+    def remove_guest(self, table_num: int, guest_id: str, lines: List[OrderItem]):
+        with self._lock:
+            if (table_num, guest_id) in self.present:
+                self.present.discard((table_num, guest_id))
+                self._remove(guest_id, table_num, 0)
+            for item in lines:
+                self._remove(f"{item.guest_id} {item.name} {item.item_id}", table_num, item.line_id)
+
+    def set_owner(self, table_num: int, previous: str | None, owner: str | None):
+        with self._lock:
+            if previous is not None:
+                self._remove(previous, table_num, 0)
+            if owner is not None:
+                self._add(owner, table_num, 0)
+
+    def search(self, query: str) -> Dict[int, Set[int]]:
+        with self._lock:
+            return self._search(search_key(query).split())
+
+    def _search(self, tokens: List[str]) -> Dict[int, Set[int]]:
+        result: Dict[int, Set[int] | None] | None = None
+        for token in tokens:
+            found: Dict[int, Set[int] | None] = {}
+            index = bisect.bisect_left(self.terms, token)
+            while index < len(self.terms) and self.terms[index].startswith(token):
+                for table_num, lines in self.postings[self.terms[index]].items():
+                    matched = {line_id for line_id in lines if line_id}
+                    if matched:
+                        found[table_num] = (found.get(table_num) or set()) | matched
+                    else:
+                        found.setdefault(table_num, None)
+                index += 1
+            if result is not None:
+                merged = {}
+                for table_num in result.keys() & found.keys():
+                    before, after = result[table_num], found[table_num]
+                    lines = after if before is None else before if after is None else before & after
+                    if lines is None or lines:
+                        merged[table_num] = lines
+                found = merged
+            result = found
+            if not result:
+                break
+        return {table_num: lines or set() for table_num, lines in (result or {}).items()}
+
+
+class TableData:
+    def __init__(self, table_number: int, index: SearchIndex | None = None):
+        self.table_number = table_number
+        self.index = index
+        self.guests: Dict[str, List[OrderItem]] = {}
+        self._merge: Dict[str, Dict[tuple[str, int, str], OrderItem]] = {}
+        self._guest_cents: Dict[str, int] = {}
+        self._total_cents = 0
+        self._unpaid: set[str] = set()
+        self._next_line = 1
+
+    def add_guest(self, guest_id: str):
+        if guest_id not in self.guests:
+            self.guests[guest_id] = []
+            self._merge[guest_id] = {}
+            self._guest_cents[guest_id] = 0
+        if self.index is not None:
+            self.index.add_guest(self.table_number, guest_id)
+
+    def add_order(self, item: OrderItem):
+        self.add_guest(item.guest_id)
+        lines = self._merge[item.guest_id]
+        line = lines.get(item.merge_key)
+        if line is not None:
+            line.qty += item.qty
+            self._next_line = max(self._next_line, item.line_id + 1)
+            item.line_id = line.line_id
+        else:
+            if item.line_id:
+                self._next_line = max(self._next_line, item.line_id + 1)
+            else:
+                item.line_id = self._next_line
+                self._next_line += 1
+            self.guests[item.guest_id].append(item)
+            lines[item.merge_key] = item
+            if self.index is not None:
+                self.index.add_line(self.table_number, item)
+        self._adjust(item.guest_id, item.total_cents)
+
+    def _adjust(self, guest_id: str, delta: int):
+        cents = self._guest_cents[guest_id] + delta
+        self._guest_cents[guest_id] = cents
+        self._total_cents += delta
+        if cents > 0:
+            self._unpaid.add(guest_id)
+        else:
+            self._unpaid.discard(guest_id)
+
+    def total_cents(self) -> int:
+        return self._total_cents
+
+    def total(self) -> float:
+        return self._total_cents / 100
+
+    def guest_total_cents(self, guest_id: str) -> int:
+        return self._guest_cents.get(guest_id, 0)
+
+    def guest_total(self, guest_id: str) -> float:
+        return self.guest_total_cents(guest_id) / 100
+
+    def totals_by_guest(self) -> Dict[str, float]:
+        return {guest: cents / 100 for guest, cents in self._guest_cents.items()}
+
+    def has_unpaid(self) -> bool:
+        return bool(self._unpaid)
+
+    def mark_guest_paid(self, guest_id: str):
+        if guest_id in self.guests:
+            if self.index is not None:
+                self.index.remove_guest(self.table_number, guest_id, self.guests[guest_id])
+            self._adjust(guest_id, -self._guest_cents[guest_id])
+            self.guests[guest_id] = []
+            self._merge[guest_id] = {}
+
+
+def write_atomic(path: Path, data: str | bytes):
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as handle:
+        handle.write(data.encode("utf-8") if isinstance(data, str) else data)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp, path)
+
+
+class PersistenceWorker:
+    def __init__(self, delay: float = AUTOSAVE_DELAY):
+        self.delay = delay
+        self._pending: Dict[Path, object] = {}
+        self._appends: Dict[Path, List[str]] = {}
+        self._notify: Set[Path] = set()
+        self._failures: Deque[tuple[Path, Exception]] = deque()
+        self._completed: Deque[tuple[Path, Exception | None]] = deque()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._urgent = False
+        self._closed = False
+        self.submitted = 0
+        self.coalesced = 0
+        self.written = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self._thread.start()
+
+    def submit(self, path: Path, payload: object, notify: bool = False):
+        with self._cond:
+            self.submitted += 1
+            if path in self._pending:
+                self.coalesced += 1
+            self._pending[path] = payload
+            if notify:
+                self._notify.add(path)
+            self._cond.notify()
+
+    def append(self, path: Path, text: str):
+        with self._cond:
+            self.submitted += 1
+            self._appends.setdefault(path, []).append(text)
+            self._cond.notify()
+
+    def take_completed(self) -> List[tuple[Path, Exception | None]]:
+        with self._cond:
+            completed = list(self._completed)
+            self._completed.clear()
+        return completed
+
+    def take_failures(self) -> List[tuple[Path, Exception]]:
+        with self._cond:
+            failures = list(self._failures)
+            self._failures.clear()
+        return failures
+
+    def flush(self, timeout: float | None = None) -> bool:
+        with self._cond:
+            self._urgent = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._pending and not self._appends and not self._busy, timeout)
+
+    def close(self, timeout: float | None = 5.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"submitted": self.submitted, "coalesced": self.coalesced, "written": self.written, "failed": self.failed, "pending": len(self._pending) + len(self._appends)}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._appends or self._closed)
+                if not self._pending and not self._appends:
+                    return
+                self._cond.wait_for(lambda: self._closed or self._urgent, self.delay)
+                self._urgent = False
+                batch, self._pending = self._pending, {}
+                appends, self._appends = self._appends, {}
+                notify = self._notify & batch.keys()
+                self._notify -= notify
+                self._busy = True
+            for path, texts in appends.items():
+                try:
+                    with path.open("a", encoding="utf-8") as handle:
+                        handle.write("".join(texts))
+                        handle.flush()
+                        os.fsync(handle.fileno())
+                except Exception as exc:
+                    with self._cond:
+                        self.failed += 1
+                        self._failures.append((path, exc))
+                else:
+                    with self._cond:
+                        self.written += 1
+            for path, payload in batch.items():
+                try:
+                    write_atomic(path, payload() if callable(payload) else json.dumps(payload, indent=2))
+                except Exception as exc:
+                    with self._cond:
+                        self.failed += 1
+                        (self._completed if path in notify else self._failures).append((path, exc))
+                else:
+                    with self._cond:
+                        self.written += 1
+                        if path in notify:
+                            self._completed.append((path, None))
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+
+class OrderJournal:
+    def __init__(self, path: Path, snapshot_path: Path):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.rotated_path = path.with_name(path.name + ".old")
+        self.events_since_snapshot = 0
+        self._handle = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._sync_lock = threading.RLock()
+
+    def load(self) -> tuple[Dict | None, List[Dict]]:
+        snapshot = None
+        if self.snapshot_path.exists():
+            snapshot = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+        events: List[Dict] = []
+        for path in (self.rotated_path, self.path):
+            if path.exists():
+                events.extend(self._load_file(path))
+        self.events_since_snapshot = len(events)
+        return snapshot, events
+
+    def _load_file(self, path: Path) -> List[Dict]:
+        data = path.read_bytes()
+        end = data.rfind(b"\n") + 1
+        try:
+            events = json.loads(b"[" + data[:end].rstrip(b"\n").replace(b"\n", b",") + b"]") if end else []
+        except ValueError:
+            events, end = self._load_lines(data)
+        if end < len(data):
+            os.truncate(path, end)
+        return events
+
+    def _load_lines(self, data: bytes) -> tuple[List[Dict], int]:
+        events: List[Dict] = []
+        end = 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            if not line.strip():
+                end += len(line)
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                break
+            end += len(line)
+        return events, end
+
+    def open(self):
+        if self._handle is None:
+            self._handle = self.path.open("a", encoding="utf-8", newline="\n")
+
+    def append(self, event: Dict) -> bool:
+        self.open()
+        self._handle.write(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._unsynced += 1
+        self.events_since_snapshot += 1
+        return self._unsynced >= JOURNAL_SYNC_BATCH or time.monotonic() - self._last_sync >= JOURNAL_SYNC_SECONDS
+
+    def flush(self) -> int | None:
+        self._last_sync = time.monotonic()
+        if self._handle is None or not self._unsynced:
+            return None
+        self._handle.flush()
+        self._unsynced = 0
+        return self._handle.fileno()
+
+    def sync_file(self, fd: int):
+        with self._sync_lock:
+            if self._handle is not None and self._handle.fileno() == fd:
+                os.fsync(fd)
+
+    def sync(self):
+        fd = self.flush()
+        if fd is not None:
+            self.sync_file(fd)
+
+    def rotate(self):
+        self.events_since_snapshot = 0
+        if self.rotated_path.exists():
+            return
+        with self._sync_lock:
+            self.close()
+            if self.path.exists():
+                os.replace(self.path, self.rotated_path)
+            self.open()
+
+    def write_snapshot(self, snapshot: Dict):
+        write_atomic(self.snapshot_path, json.dumps(snapshot, ensure_ascii=False, separators=(",", ":")))
+        if self.rotated_path.exists():
+            self.rotated_path.unlink()
+
+    def close(self):
+        with self._sync_lock:
+            self.sync()
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+
+class CoreError(Exception):
+    pass
+
+
+class AccessDenied(CoreError):
+    pass
+
+
+class VersionConflict(CoreError):
+    pass
+
+
+class RestaurantCore:
+    def __init__(self, journal: OrderJournal | None = None, sales: SalesStore | None = None):
+        self.journal = journal
+        self.sales = sales if sales is not None else SalesStore()
+        self.tables: Dict[int, TableData] = {}
+        self.owners: Dict[int, str | None] = {}
+        self.versions: Dict[int, int] = {}
+        self.table_seqs: Dict[int, int] = {}
+        self.states: Dict[int, str] = {}
+        self.waiter_tables: Dict[str, Set[int]] = {}
+        self.index = SearchIndex()
+        self.seq = 0
+        self._locks: Dict[int, threading.RLock] = {}
+        self._commit_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._recent: Deque[Dict] = deque(maxlen=RECENT_EVENTS)
+        self._failures: Deque[Exception] = deque(maxlen=RECENT_EVENTS)
+        self._listeners: List[Callable[[Dict], None]] = []
+
+    def subscribe(self, listener: Callable[[Dict], None]):
+        self._listeners.append(listener)
+
+    def table(self, table_num: int) -> TableData:
+        table = self.tables.get(table_num)
+        if table is None:
+            table = self.tables.setdefault(table_num, TableData(table_num, self.index))
+        return table
+
+    def owner(self, table_num: int) -> str | None:
+        return self.owners.get(table_num)
+
+    def version(self, table_num: int) -> int:
+        return self.versions.get(table_num, 0)
+
+    def state(self, table_num: int) -> str:
+        return self.states.get(table_num, TABLE_FREE)
+
+    def tables_of(self, code: str) -> Set[int]:
+        return set(self.waiter_tables.get(code, ()))
+
+    def is_free(self, table_num: int) -> bool:
+        return self.owners.get(table_num) is None
+
+    def search(self, query: str) -> Dict[int, Set[int]]:
+        return self.index.search(query)
+
+    def accessible(self, table_num: int, code: str | None, all_tables: bool = False) -> bool:
+        if code is None:
+            return False
+        return all_tables or self.owners.get(table_num) in (None, code)
+
+    def claim(self, table_num: int, code: str, version: int | None = None, all_tables: bool = False) -> int:
+        with self._lock(table_num):
+            self._check(table_num, code, version, all_tables)
+            if self.is_free(table_num):
+                self._set_owner(table_num, code)
+            result = self.version(table_num)
+        self._maybe_compact()
+        return result
+
+    def add_guest(self, table_num: int, guest_id: str, code: str, version: int | None = None, all_tables: bool = False) -> int:
+        with self._lock(table_num):
+            self._check(table_num, code, version, all_tables)
+            self._auto_claim(table_num, code)
+            self.table(table_num).add_guest(guest_id)
+            self._commit({"type": "guest", "table": table_num, "guest": guest_id})
+            result = self.version(table_num)
+        self._maybe_compact()
+        return result
+
+    def add_order(self, table_num: int, item: OrderItem, code: str, version: int | None = None, all_tables: bool = False) -> int:
+        with self._lock(table_num):
+            self._check(table_num, code, version, all_tables)
+            self._auto_claim(table_num, code)
+            self.table(table_num).add_order(item)
+            event = {"type": "order", "table": table_num, "guest": item.guest_id, "name": item.name, "qty": item.qty, "cents": item.unit_cents}
+            if item.item_id:
+                event["item"] = item.item_id
+            self._commit(event)
+            result = self.version(table_num)
+        self._maybe_compact()
+        return result
+
+    def pay_guest(self, table_num: int, guest_id: str, method: str, code: str, version: int | None = None, all_tables: bool = False) -> int:
+        with self._lock(table_num):
+            self._check(table_num, code, version, all_tables)
+            table = self.table(table_num)
+            cents = table.guest_total_cents(guest_id)
+            waiter = self.owners.get(table_num) or code
+            lines = self._sale_lines(table, guest_id)
+            table.mark_guest_paid(guest_id)
+            event = {"type": "paid", "table": table_num, "guest": guest_id, "method": method, "cents": cents, "waiter": waiter, "time": time.time()}
+            self._commit(event)
+            self.sales.record(table_num, waiter, method, lines, event["time"], event["seq"])
+            if not table.has_unpaid() and self.owners.get(table_num) is not None:
+                self._set_owner(table_num, None)
+        self._maybe_compact()
+        return cents
+
+    def release(self, table_num: int, code: str, version: int | None = None, all_tables: bool = False) -> int:
+        with self._lock(table_num):
+            self._check(table_num, code, version, all_tables)
+            if not self.is_free(table_num) and not self.table(table_num).has_unpaid():
+                self._set_owner(table_num, None)
+            result = self.version(table_num)
+        self._maybe_compact()
+        return result
+
+    def sales_report(self, start: float | None = None, end: float | None = None) -> Dict:
+        return self.sales.report(start, end)
+
+    def _sale_lines(self, table: TableData, guest_id: str) -> List[tuple[str, str, int, int]]:
+        return [(item.item_id, item.name, item.qty, item.unit_cents) for item in table.guests.get(guest_id, [])]
+
+    def _lock(self, table_num: int) -> threading.RLock:
+        lock = self._locks.get(table_num)
+        if lock is None:
+            lock = self._locks.setdefault(table_num, threading.RLock())
+        return lock
+
+    def _check(self, table_num: int, code: str, version: int | None, all_tables: bool = False):
+        if version is not None and version != self.version(table_num):
+            raise VersionConflict(f"Laud {table_num} muutus vahepeal (versioon {self.version(table_num)}, oodati {version}).")
+        if not self.accessible(table_num, code, all_tables):
+            raise AccessDenied(f"Laud {table_num} on teise teenindaja kasutuses.")
+
+    def _auto_claim(self, table_num: int, code: str):
+        if self.is_free(table_num):
+            self._set_owner(table_num, code)
+
+    def _set_owner(self, table_num: int, owner: str | None):
+        self._assign_owner(table_num, owner)
+        self._commit({"type": "owner", "table": table_num, "owner": owner})
+
+    def _assign_owner(self, table_num: int, owner: str | None):
+        previous = self.owners.get(table_num)
+        if previous is not None:
+            self.waiter_tables.get(previous, set()).discard(table_num)
+        self.index.set_owner(table_num, previous, owner)
+        self.owners[table_num] = owner
+        if owner is not None:
+            self.waiter_tables.setdefault(owner, set()).add(table_num)
+
+    def _advance(self, event: Dict) -> Dict | None:
+        table_num = event["table"]
+        kind = event["type"]
+        current = self.states.get(table_num, TABLE_FREE)
+        if self.owners.get(table_num) is None:
+            state = TABLE_FREE
+        elif kind == "owner":
+            state = TABLE_OPEN if self.table(table_num).has_unpaid() else TABLE_CLAIMED
+        elif kind == "order" and self.table(table_num).has_unpaid():
+            state = TABLE_OPEN
+        elif kind == "paid" and current == TABLE_OPEN and not self.table(table_num).has_unpaid():
+            state = TABLE_SETTLED
+        else:
+            return None
+        if state == current:
+            return None
+        if state == TABLE_FREE:
+            self.states.pop(table_num, None)
+        else:
+            self.states[table_num] = state
+        return {"type": "state", "table": table_num, "state": state, "previous": current}
+
+    def _notify(self, event: Dict, transition: Dict | None):
+        for listener in self._listeners:
+            listener(event)
+            if transition is not None:
+                listener(transition)
+
+    def _commit(self, event: Dict):
+        table_num = event["table"]
+        self.versions[table_num] = event["version"] = self.versions.get(table_num, 0) + 1
+        fd = None
+        with self._commit_lock:
+            self.seq += 1
+            event["seq"] = self.table_seqs[table_num] = self.seq
+            if self.journal is not None and self.journal.append(event):
+                fd = self.journal.flush()
+            self._recent.append(event)
+        if fd is not None:
+            self.journal.sync_file(fd)
+        self._notify(event, self._advance(event))
+
+    def apply(self, event: Dict, record_sales: bool = False):
+        table_num = event["table"]
+        seq = event.get("seq", 0)
+        if seq and seq <= self.table_seqs.get(table_num, 0):
+            return
+        table = self.table(table_num)
+        kind = event["type"]
+        if kind == "guest":
+            table.add_guest(event["guest"])
+        elif kind == "order":
+            table.add_order(OrderItem(event["guest"], event["name"], event["qty"], event["cents"], item_id=event.get("item", "")))
+        elif kind == "paid":
+            if record_sales and "time" in event and seq > self.sales.last_seq:
+                waiter = event.get("waiter") or self.owners.get(table_num) or ""
+                self.sales.record(table_num, waiter, event.get("method", "cash"), self._sale_lines(table, event["guest"]), event.get("time"), seq)
+            table.mark_guest_paid(event["guest"])
+        elif kind == "owner":
+            self._assign_owner(table_num, event["owner"])
+        self.versions[table_num] = event.get("version", self.version(table_num) + 1)
+        if seq:
+            self.table_seqs[table_num] = seq
+            self.seq = max(self.seq, seq)
+            self._recent.append(event)
+        self._notify(event, self._advance(event))
+
+    def changes_since(self, seq: int) -> List[Dict] | None:
+        with self._commit_lock:
+            if seq >= self.seq:
+                return []
+            if not self._recent or self._recent[0]["seq"] > seq + 1:
+                return None
+            return [event for event in self._recent if event["seq"] > seq]
+
+    def snapshot(self) -> Dict:
+        seq = self.seq
+        tables = {}
+        for table_num in list(self.tables):
+            with self._lock(table_num):
+                table = self.tables[table_num]
+                guests = {guest: [[item.name, item.qty, item.unit_cents, item.line_id] + ([item.item_id] if item.item_id else []) for item in items] for guest, items in table.guests.items()}
+                tables[str(table_num)] = {
+                    "owner": self.owners.get(table_num),
+                    "state": self.state(table_num),
+                    "version": self.version(table_num),
+                    "seq": self.table_seqs.get(table_num, 0),
+                    "next_line": table._next_line,
+                    "guests": guests,
+                }
+                paid = [guest for guest, items in table.guests.items() if not items and (table_num, guest) not in self.index.present]
+                if paid:
+                    tables[str(table_num)]["paid"] = paid
+        return {"seq": seq, "tables": tables}
+
+    def restore(self, snapshot: Dict):
+        self.tables, self.owners, self.versions, self.table_seqs = {}, {}, {}, {}
+        self.states, self.waiter_tables = {}, {}
+        self.index.clear()
+        self._recent.clear()
+        self.seq = snapshot.get("seq", 0)
+        for key, state in snapshot.get("tables", {}).items():
+            table_num = int(key)
+            table = self.tables[table_num] = TableData(table_num, self.index)
+            for guest, lines in state.get("guests", {}).items():
+                table.add_guest(guest)
+                for name, qty, cents, *rest in lines:
+                    table.add_order(OrderItem(guest, name, qty, cents, *rest))
+            for guest in state.get("paid", []):
+                self.index.remove_guest(table_num, guest, [])
+            table._next_line = max(table._next_line, state.get("next_line", 1))
+            self._assign_owner(table_num, state.get("owner"))
+            if state.get("owner") is not None:
+                self.states[table_num] = state.get("state") or (TABLE_OPEN if table.has_unpaid() else TABLE_CLAIMED)
+            self.versions[table_num] = state.get("version", 0)
+            self.table_seqs[table_num] = state.get("seq", 0)
+        for listener in self._listeners:
+            listener({"type": "reset"})
+
+    def recover(self):
+        if self.journal is None:
+            return
+        snapshot, events = self.journal.load()
+        if snapshot is not None:
+            self.restore(snapshot)
+        for event in events:
+            self.apply(event, record_sales=True)
+        self.journal.open()
+        self._maybe_compact()
+
+    def maintenance(self):
+        if self.journal is not None:
+            with self._commit_lock:
+                fd = self.journal.flush()
+            if fd is not None:
+                self.journal.sync_file(fd)
+        self.sales.sync()
+        self._maybe_compact()
+
+    def poll(self) -> None:
+        pass
+
+    def _maybe_compact(self):
+        journal = self.journal
+        if journal is None or journal.events_since_snapshot < JOURNAL_COMPACT_EVENTS:
+            return
+        if not self._compact_lock.acquire(blocking=False):
+            return
+        try:
+            with self._commit_lock:
+                journal.rotate()
+            journal.write_snapshot(self.snapshot())
+        except OSError as exc:
+            self._failures.append(exc)
+        finally:
+            self._compact_lock.release()
+
+    def take_failures(self) -> List[Exception]:
+        failures = list(self._failures)
+        self._failures.clear()
+        return failures
+
+    def close(self):
+        if self.journal is not None:
+            with self._commit_lock:
+                self.journal.close()
+        self.sales.close()
+
+
+def parse_address(address: str) -> tuple[str, str | int]:
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class CoreServer:
+    def __init__(self, core: RestaurantCore, address: str = DEFAULT_ADDRESS):
+        self.core = core
+        self.address = address
+        self._server: asyncio.AbstractServer | None = None
+        self._maintainer: asyncio.Task | None = None
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    async def start(self):
+        host, port = parse_address(self.address)
+        if host == "unix":
+            self._server = await asyncio.start_unix_server(self._handle, path=port)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+        self._maintainer = asyncio.get_running_loop().create_task(self._maintain())
+
+    async def stop(self):
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _maintain(self):
+        while True:
+            await asyncio.sleep(JOURNAL_SYNC_SECONDS)
+            await asyncio.to_thread(self.core.maintenance)
+            for exc in self.core.take_failures():
+                print(f"Logi kokkupakkimine ebaõnnestus: {exc}", file=sys.stderr)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = await asyncio.to_thread(self.dispatch, json.loads(line))
+                except ValueError as exc:
+                    response = {"ok": False, "error": "CoreError", "message": str(exc)}
+                writer.write(json.dumps(response, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    def dispatch(self, request: Dict) -> Dict:
+        # Codes are trusted as sent: terminals verify credentials, so only expose the server to trusted clients.
+        core = self.core
+        op = request.get("op")
+        args = request.get("args", {})
+        try:
+            if op == "snapshot":
+                result = core.snapshot()
+            elif op == "changes":
+                result = None
+            elif op == "claim":
+                result = core.claim(args["table"], args["code"], args.get("version"), bool(args.get("all_tables")))
+            elif op == "release":
+                result = core.release(args["table"], args["code"], args.get("version"), bool(args.get("all_tables")))
+            elif op == "add_guest":
+                result = core.add_guest(args["table"], args["guest"], args["code"], args.get("version"), bool(args.get("all_tables")))
+            elif op == "add_order":
+                item = OrderItem(args["guest"], args["name"], int(args["qty"]), int(args["cents"]), item_id=args.get("item", ""))
+                result = core.add_order(args["table"], item, args["code"], args.get("version"), bool(args.get("all_tables")))
+            elif op == "pay_guest":
+                result = core.pay_guest(args["table"], args["guest"], args["method"], args["code"], args.get("version"), bool(args.get("all_tables")))
+            elif op == "sales_report":
+                result = core.sales_report(args.get("start"), args.get("end"))
+            else:
+                raise CoreError(f"Tundmatu operatsioon: {op}")
+            response = {"ok": True, "result": result}
+        except CoreError as exc:
+            response = {"ok": False, "error": type(exc).__name__, "message": str(exc)}
+        except (KeyError, TypeError, ValueError) as exc:
+            response = {"ok": False, "error": "CoreError", "message": f"Vigane päring: {exc}"}
+        if "since" in request:
+            response["changes"] = core.changes_since(int(request["since"]))
+        return response
+
+
+class CoreClient:
+    ERRORS = {"AccessDenied": AccessDenied, "VersionConflict": VersionConflict}
+
+    def __init__(self, address: str = DEFAULT_ADDRESS, timeout: float = 5.0):
+        self.address = address
+        self.timeout = timeout
+        self.mirror = RestaurantCore()
+        self._sock: socket.socket | None = None
+        self._reader = None
+        self._connect()
+        self.mirror.restore(self._call("snapshot", sync=False))
+
+    @property
+    def tables(self) -> Dict[int, TableData]:
+        return self.mirror.tables
+
+    def subscribe(self, listener: Callable[[Dict], None]):
+        self.mirror.subscribe(listener)
+
+    def table(self, table_num: int) -> TableData:
+        return self.mirror.table(table_num)
+
+    def owner(self, table_num: int) -> str | None:
+        return self.mirror.owner(table_num)
+
+    def version(self, table_num: int) -> int:
+        return self.mirror.version(table_num)
+
+    def state(self, table_num: int) -> str:
+        return self.mirror.state(table_num)
+
+    def tables_of(self, code: str) -> Set[int]:
+        return self.mirror.tables_of(code)
+
+    def is_free(self, table_num: int) -> bool:
+        return self.mirror.is_free(table_num)
+
+    def search(self, query: str) -> Dict[int, Set[int]]:
+        return self.mirror.search(query)
+
+    def accessible(self, table_num: int, code: str | None, all_tables: bool = False) -> bool:
+        return self.mirror.accessible(table_num, code, all_tables)
+
+    def claim(self, table_num: int, code: str, version: int | None = None, all_tables: bool = False) -> int:
+        return self._call("claim", table=table_num, code=code, version=version, all_tables=all_tables)
+
+    def release(self, table_num: int, code: str, version: int | None = None, all_tables: bool = False) -> int:
+        return self._call("release", table=table_num, code=code, version=version, all_tables=all_tables)
+
+    def add_guest(self, table_num: int, guest_id: str, code: str, version: int | None = None, all_tables: bool = False) -> int:
+        return self._call("add_guest", table=table_num, guest=guest_id, code=code, version=version, all_tables=all_tables)
+
+    def add_order(self, table_num: int, item: OrderItem, code: str, version: int | None = None, all_tables: bool = False) -> int:
+        return self._call("add_order", table=table_num, guest=item.guest_id, name=item.name, qty=item.qty, cents=item.unit_cents, item=item.item_id, code=code, version=version, all_tables=all_tables)
+
+    def pay_guest(self, table_num: int, guest_id: str, method: str, code: str, version: int | None = None, all_tables: bool = False) -> int:
+        return self._call("pay_guest", table=table_num, guest=guest_id, method=method, code=code, version=version, all_tables=all_tables)
+
+    def sales_report(self, start: float | None = None, end: float | None = None) -> Dict:
+        return self._call("sales_report", start=start, end=end)
+
+    def poll(self):
+        self._call("changes")
+
+    def maintenance(self):
+        self.poll()
+
+    def take_failures(self) -> List[Exception]:
+        return []
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _connect(self):
+        host, port = parse_address(self.address)
+        try:
+            if host == "unix":
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                sock.connect(port)
+            else:
+                sock = socket.create_connection((host, port), timeout=self.timeout)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError as exc:
+            raise CoreError(f"Serveriga {self.address} ei saanud ühendust: {exc}") from exc
+        self._sock = sock
+        self._reader = sock.makefile("rb")
+
+    def _call(self, op: str, sync: bool = True, **args):
+        request: Dict = {"op": op, "args": args}
+        if sync:
+            request["since"] = self.mirror.seq
+        payload = json.dumps(request, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        try:
+            if self._sock is None:
+                self._connect()
+            self._sock.sendall(payload)
+            line = self._reader.readline()
+        except OSError as exc:
+            self.close()
+            raise CoreError(f"Ühendus serveriga katkes: {exc}") from exc
+        if not line:
+            self.close()
+            raise CoreError("Server sulges ühenduse.")
+        response = json.loads(line)
+        if sync:
+            changes = response.get("changes")
+            if changes is None:
+                self.mirror.restore(self._call("snapshot", sync=False))
+            else:
+                for event in changes:
+                    self.mirror.apply(event)
+        if not response.get("ok"):
+            raise self.ERRORS.get(response.get("error"), CoreError)(response.get("message", ""))
+        return response.get("result")
+
+
+def open_local_core(directory: Path = Path(".")) -> RestaurantCore:
+    core = RestaurantCore(OrderJournal(directory / JOURNAL_FILE, directory / SNAPSHOT_FILE), SalesStore(directory / SALES_FILE).open())
+    core.recover()
+    return core
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lauateeninduse keskserver")
+    parser.add_argument("--serve", default=DEFAULT_ADDRESS, help="host:port või unix:/tee/pesa")
+    parser.add_argument("--data-dir", default=".", help="logi ja hetktõmmise kataloog")
+    args = parser.parse_args()
+    core = open_local_core(Path(args.data_dir))
+    try:
+        asyncio.run(CoreServer(core, args.serve).serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        core.close()
+
+
+if __name__ == "__main__":
+    main()
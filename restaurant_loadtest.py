@@ -0,0 +1,288 @@
+import argparse
+import asyncio
+import json
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from restaurant_core import (
+    TABLE_FREE,
+    TABLE_OPEN,
+    AccessDenied,
+    CoreClient,
+    CoreError,
+    CoreServer,
+    OrderItem,
+    RestaurantCore,
+    VersionConflict,
+    open_local_core,
+)
+from restaurant_metrics import Instrumentation
+
+DEFAULT_WAITERS = 8
+DEFAULT_TABLES = 12
+DEFAULT_FLOWS = 200
+LOGOUT_RATE = 0.2
+FIRST_WAITER_CODE = 5000
+MENU = (("Supp", 450), ("Praad", 1290), ("Salat", 780), ("Kohv", 250), ("Vesi", 150), ("Kook", 520), ("Vein", 690))
+
+
+class Waiter:
+    def __init__(self, code: str, core: RestaurantCore | CoreClient, tables: List[int], rng: random.Random, metrics: Instrumentation):
+        self.code = code
+        self.core = core
+        self.tables = tables
+        self.rng = rng
+        self.metrics = metrics
+        self.calls: Counter = Counter()
+        self.denied: Counter = Counter()
+        self.conflicts: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.issued_qty = 0
+        self.issued_cents = 0
+        self.paid_cents = 0
+
+    def _call(self, name: str, func: Callable, *args):
+        self.calls[name] += 1
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        except AccessDenied:
+            self.denied[name] += 1
+        except VersionConflict:
+            self.conflicts[name] += 1
+        except CoreError:
+            self.errors[name] += 1
+        finally:
+            self.metrics.record(name, time.perf_counter() - start)
+        return None
+
+    def flow(self):
+        rng, core, code = self.rng, self.core, self.code
+        table_num = rng.choice(self.tables)
+        if self._call("claim", core.claim, table_num, code, core.version(table_num)) is None:
+            return
+        guests = [f"K{n}" for n in range(1, rng.randint(1, 4) + 1)]
+        for guest in guests:
+            self._call("guest", core.add_guest, table_num, guest, code)
+        for _ in range(rng.randint(1, 6)):
+            name, cents = rng.choice(MENU)
+            qty = rng.randint(1, 3)
+            if self._call("order", core.add_order, table_num, OrderItem(rng.choice(guests), name, qty, cents), code) is not None:
+                self.issued_qty += qty
+                self.issued_cents += qty * cents
+        for guest in guests:
+            paid = self._call("pay", core.pay_guest, table_num, guest, rng.choice(("cash", "card")), code)
+            if paid is not None:
+                self.paid_cents += paid
+        if rng.random() < LOGOUT_RATE:
+            self.logout()
+
+    def logout(self):
+        for table_num in sorted(self.core.tables_of(self.code)):
+            self._call("release", self.core.release, table_num, self.code)
+
+    def run(self, flows: int):
+        for _ in range(flows):
+            self.flow()
+        self.logout()
+
+
+class OwnershipTracker:
+    def __init__(self):
+        self.takeovers = 0
+        self.transfers = 0
+        self._lock = threading.Lock()
+
+    def observe(self, core: RestaurantCore):
+        previous: Dict[int, str | None] = {}
+
+        def listener(event: Dict):
+            if event.get("type") != "owner":
+                return
+            with self._lock:
+                before = previous.get(event["table"])
+                if before is not None and event["owner"] is not None and before != event["owner"]:
+                    self.takeovers += 1
+                previous[event["table"]] = event["owner"]
+                self.transfers += 1
+
+        core.subscribe(listener)
+
+
+def check_invariants(core: RestaurantCore, waiters: List[Waiter]) -> List[str]:
+    problems = []
+    holders: Dict[int, List[str]] = {}
+    for code, tables in core.waiter_tables.items():
+        for table_num in tables:
+            holders.setdefault(table_num, []).append(code)
+    for table_num in set(holders) | set(core.owners):
+        owner = core.owners.get(table_num)
+        codes = holders.get(table_num, [])
+        if len(codes) > 1:
+            problems.append(f"laud {table_num}: mitu omanikku {sorted(codes)}")
+        elif codes != ([owner] if owner is not None else []):
+            problems.append(f"laud {table_num}: omanik {owner}, indeksis {codes}")
+    open_qty = open_cents = 0
+    for table_num, table in core.tables.items():
+        lines = [item for items in table.guests.values() for item in items]
+        cents = sum(item.total_cents for item in lines)
+        if cents != table.total_cents() or cents != sum(table.guest_total_cents(guest) for guest in table.guests):
+            problems.append(f"laud {table_num}: summa {table.total_cents()} ≠ ridade summa {cents}")
+        state = core.state(table_num)
+        if core.owners.get(table_num) is None and state != TABLE_FREE:
+            problems.append(f"laud {table_num}: omanikuta, kuid olek {state}")
+        if core.owners.get(table_num) is not None and table.has_unpaid() and state != TABLE_OPEN:
+            problems.append(f"laud {table_num}: tasumata, kuid olek {state}")
+        open_qty += sum(item.qty for item in lines)
+        open_cents += cents
+    issued_qty = sum(waiter.issued_qty for waiter in waiters)
+    issued_cents = sum(waiter.issued_cents for waiter in waiters)
+    paid_cents = sum(waiter.paid_cents for waiter in waiters)
+    sales = core.sales_report()
+    if issued_qty != open_qty + sales["qty"]:
+        problems.append(f"read kadunud: tellitud {issued_qty} tk, avatud {open_qty} + müüdud {sales['qty']}")
+    if issued_cents != open_cents + paid_cents:
+        problems.append(f"summad ei klapi: tellitud {issued_cents}, avatud {open_cents} + makstud {paid_cents}")
+    if sales["cents"] != paid_cents:
+        problems.append(f"müügisalv {sales['cents']} ≠ maksed {paid_cents}")
+    return problems
+
+
+def compare_snapshots(label: str, expected: Dict, actual: Dict) -> List[str]:
+    problems = []
+    for key in sorted(set(expected["tables"]) | set(actual["tables"]), key=int):
+        if expected["tables"].get(key) != actual["tables"].get(key):
+            problems.append(f"{label}: laud {key} erineb")
+    return problems
+
+
+def free_address() -> str:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return f"127.0.0.1:{probe.getsockname()[1]}"
+
+
+def start_server(core: RestaurantCore) -> tuple[str, Callable[[], None]]:
+    address = free_address()
+    server = CoreServer(core, address)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="loadtest-server", daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result(5)
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(server.stop(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+    return address, stop
+
+
+def run_load(waiters: int, tables: int, flows: int, mode: str, seed: int, directory: Path) -> Dict:
+    core = open_local_core(directory)
+    tracker = OwnershipTracker()
+    tracker.observe(core)
+    metrics = Instrumentation(enabled=True)
+    table_nums = list(range(1, tables + 1))
+    stop_server = None
+    if mode == "server":
+        address, stop_server = start_server(core)
+        clients = [CoreClient(address) for _ in range(waiters)]
+    else:
+        clients = [core] * waiters
+    crew = [Waiter(str(FIRST_WAITER_CODE + n), client, table_nums, random.Random(seed * 1000 + n), metrics) for n, client in enumerate(clients)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=waiters) as pool:
+        for future in [pool.submit(waiter.run, flows) for waiter in crew]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    problems = check_invariants(core, crew)
+    if tracker.takeovers:
+        problems.append(f"{tracker.takeovers} lauda võeti teiselt teenindajalt üle ilma vabastamata")
+    expected = core.snapshot()
+    if mode == "server":
+        observer = CoreClient(clients[0].address)
+        problems += compare_snapshots("kliendi peegel", expected, observer.mirror.snapshot())
+        for client in clients + [observer]:
+            client.close()
+        stop_server()
+    core.close()
+    replayed = open_local_core(directory)
+    problems += compare_snapshots("logi taastamine", expected, replayed.snapshot())
+    replayed.close()
+
+    calls = sum((waiter.calls for waiter in crew), Counter())
+    denied = sum((waiter.denied for waiter in crew), Counter())
+    conflicts = sum((waiter.conflicts for waiter in crew), Counter())
+    errors = sum((waiter.errors for waiter in crew), Counter())
+    total = sum(calls.values())
+    operations = metrics.snapshot()["operations"]
+    for name, summary in operations.items():
+        summary["denied"] = denied[name]
+        summary["conflicts"] = conflicts[name]
+        summary["errors"] = errors[name]
+    return {
+        "mode": mode,
+        "waiters": waiters,
+        "tables": tables,
+        "flows": waiters * flows,
+        "seconds": elapsed,
+        "ops": total,
+        "ops_per_s": total / elapsed if elapsed else 0.0,
+        "contention_rate": sum(denied.values()) / total if total else 0.0,
+        "conflict_rate": sum(conflicts.values()) / total if total else 0.0,
+        "error_rate": sum(errors.values()) / total if total else 0.0,
+        "owner_changes": tracker.transfers,
+        "takeovers": tracker.takeovers,
+        "operations": operations,
+        "violations": problems,
+    }
+
+
+def print_report(result: Dict):
+    print(f"\n== {result['mode']}: {result['waiters']} teenindajat, {result['tables']} lauda, {result['flows']} voogu, {result['seconds']:.2f} s")
+    print(f"{result['ops']} operatsiooni, {result['ops_per_s']:.0f} op/s; lukus {result['contention_rate'] * 100:.1f}%, "
+          f"versioonikonflikte {result['conflict_rate'] * 100:.1f}%, vigu {result['error_rate'] * 100:.1f}%")
+    print(f"omanikuvahetusi {result['owner_changes']}, neist ülevõtmisi {result['takeovers']}")
+    print(f"{'operatsioon':<12}{'arv':>8}{'lukus':>8}{'konfl':>8}{'keskm ms':>11}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, s in result["operations"].items():
+        print(f"{name:<12}{s['count']:>8}{s['denied']:>8}{s['conflicts']:>8}{s['mean_ms']:>11.3f}{s['p95_ms']:>10.3f}{s['p99_ms']:>10.3f}")
+    for problem in result["violations"]:
+        print(f"RIKKUMINE {problem}")
+    if not result["violations"]:
+        print("Invariandid korras.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mitme teenindaja koormustest omaniku- ja tellimusradadele")
+    parser.add_argument("--waiters", type=int, default=DEFAULT_WAITERS)
+    parser.add_argument("--tables", type=int, default=DEFAULT_TABLES, help="jagatud laudade arv (vähem laudu = rohkem konkurentsi)")
+    parser.add_argument("--flows", type=int, default=DEFAULT_FLOWS, help="voogude arv teenindaja kohta (võta laud, külalised, tellimused, makse)")
+    parser.add_argument("--mode", choices=("local", "server", "both"), default="both", help="otse tuumaga või keskserveri kaudu")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="kirjuta tulemused JSON-faili")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("local", "server") if args.mode == "both" else (args.mode,):
+        with tempfile.TemporaryDirectory() as directory:
+            results[mode] = run_load(args.waiters, args.tables, args.flows, mode, args.seed, Path(directory))
+        print_report(results[mode])
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    if any(result["violations"] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import bisect
+import heapq
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Set
+
+from restaurant_core import search_key, to_cents
+
+MENU_FILE = "menu_catalog.json"
+SEARCH_LIMIT = 20
+SEARCH_CACHE_SIZE = 512
+TRIGRAM_MIN_QUERY = 3
+TRIGRAM_MIN_SCORE = 0.4
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass(frozen=True)
+class MenuItem:
+    item_id: str
+    name: str
+    cents: int
+    category: str = ""
+    station: str = ""
+
+    @property
+    def price(self) -> float:
+        return self.cents / 100
+
+
+def read_catalog(path: Path) -> List[MenuItem]:
+    data = json.loads(path.read_text(encoding="utf-8"))
+    rows = data.get("items", []) if isinstance(data, dict) else data
+    items: List[MenuItem] = []
+    seen: Set[str] = set()
+    for index, row in enumerate(rows, 1):
+        try:
+            item_id = str(row["id"]).strip()
+            cents = int(row["cents"]) if "cents" in row else to_cents(row["price"])
+            item = MenuItem(item_id, str(row["name"]).strip(), cents, str(row.get("category", "")).strip(), str(row.get("station", "")).strip())
+        except KeyError as exc:
+            raise ValueError(f"toode {index}: puudub väli {exc}") from exc
+        except (TypeError, ArithmeticError) as exc:
+            raise ValueError(f"toode {index}: vigane hind") from exc
+        if not item.item_id or not item.name:
+            raise ValueError(f"toode {index}: id ja nimi on kohustuslikud")
+        if item.item_id in seen:
+            raise ValueError(f"toote id {item.item_id} on mitu korda")
+        seen.add(item.item_id)
+        items.append(item)
+    return items
+
+
+class MenuCatalog:
+    def __init__(self, path: Path | None = None):
+        self.path = path
+        self.items: Dict[str, MenuItem] = {}
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._mtime: int | None = None
+        self._names: Dict[str, str] = {}
+        self._ids: Dict[str, str] = {}
+        self._tokens: List[tuple[str, str]] = []
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._browse: List[str] = []
+        self._cache: "OrderedDict[tuple[str, int], List[MenuItem]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def get(self, item_id: str) -> MenuItem | None:
+        return self.items.get(item_id)
+
+    def load(self, items: List[MenuItem]):
+        self.items = {item.item_id: item for item in items}
+        self._names = {item.item_id: search_key(item.name) for item in items}
+        self._ids = {search_key(item.item_id): item.item_id for item in items}
+        tokens = set()
+        self._trigrams = {}
+        for item_id, name in self._names.items():
+            tokens.update((token, item_id) for token in name.split())
+            tokens.add((search_key(item_id), item_id))
+            for gram in trigrams(name):
+                self._trigrams.setdefault(gram, set()).add(item_id)
+        self._tokens = sorted(tokens)
+        self._browse = sorted(self._names, key=lambda item_id: (self.items[item_id].category, self._names[item_id]))
+        self._cache.clear()
+        self.version += 1
+
+    def reload_if_changed(self) -> bool:
+        if self.path is None:
+            return False
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        self.load(read_catalog(self.path) if mtime is not None else [])
+        return True
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> List[MenuItem]:
+        key = (search_key(query), limit)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return cached
+        self.misses += 1
+        result = [self.items[item_id] for item_id in self._lookup(key[0], limit)]
+        self._cache[key] = result
+        if len(self._cache) > SEARCH_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return result
+
+    def _lookup(self, text: str, limit: int) -> List[str]:
+        names = self._names
+        if not text:
+            return self._browse[:limit]
+        matches: Set[str] | None = None
+        for token in text.split():
+            found = set()
+            index = bisect.bisect_left(self._tokens, (token, ""))
+            while index < len(self._tokens) and self._tokens[index][0].startswith(token):
+                found.add(self._tokens[index][1])
+                index += 1
+            matches = found if matches is None else matches & found
+            if not matches:
+                break
+        exact = self._ids.get(text)
+        if matches:
+            return heapq.nsmallest(limit, matches, key=lambda item_id: (item_id != exact, not names[item_id].startswith(text), names[item_id]))
+        if exact is not None:
+            return [exact]
+        if len(text) < TRIGRAM_MIN_QUERY:
+            return []
+        grams = trigrams(text)
+        scores: Dict[str, int] = {}
+        for gram in grams:
+            for item_id in self._trigrams.get(gram, ()):
+                scores[item_id] = scores.get(item_id, 0) + 1
+        candidates = (item_id for item_id, score in scores.items() if score >= TRIGRAM_MIN_SCORE * len(grams))
+        return heapq.nsmallest(limit, candidates, key=lambda item_id: (-scores[item_id], names[item_id]))
+
+    def stats(self) -> Dict[str, int]:
+        return {"items": len(self.items), "version": self.version, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,100 @@
+import functools
+import json
+import math
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+BUCKETS_PER_OCTAVE = 4
+BUCKET_COUNT = 128
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.buckets = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        micros = seconds * 1_000_000
+        index = int(math.log2(micros) * BUCKETS_PER_OCTAVE) if micros > 1 else 0
+        self.buckets[min(index, BUCKET_COUNT - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * fraction))
+        seen = 0
+        for index, hits in enumerate(self.buckets):
+            seen += hits
+            if seen >= rank:
+                return min(self.max, 2 ** ((index + 1) / BUCKETS_PER_OCTAVE) / 1_000_000)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(0.50) * 1000,
+            "p95_ms": self.percentile(0.95) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class Instrumentation:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.operations: Dict[str, LatencyHistogram] = {}
+        self.gauges: Dict[str, float] = {}
+        self.sources: Dict[str, Callable[[], Dict]] = {}
+
+    def timed(self, name: str):
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def record(self, name: str, seconds: float):
+        histogram = self.operations.get(name)
+        if histogram is None:
+            histogram = self.operations[name] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def add_source(self, name: str, source: Callable[[], Dict]):
+        self.sources[name] = source
+
+    def reset(self):
+        self.operations.clear()
+        self.gauges.clear()
+
+    def snapshot(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "operations": {name: hist.summary() for name, hist in sorted(self.operations.items())},
+            "gauges": dict(sorted(self.gauges.items())),
+            "sources": {name: source() for name, source in sorted(self.sources.items())},
+        }
+
+    def export(self, path: Path):
+        path.write_text(json.dumps(self.snapshot(), indent=2), encoding="utf-8")
+
+
+METRICS = Instrumentation(enabled=os.environ.get("RESTAURANT_METRICS") == "1")
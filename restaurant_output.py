@@ -0,0 +1,297 @@
+import json
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, List, Protocol
+
+from restaurant_core import parse_address, write_atomic
+from restaurant_metrics import LatencyHistogram
+
+OUTPUT_CONFIG_FILE = "output_config.json"
+OUTPUT_SPOOL_DIR = "output_spool"
+DEFAULT_ROUTE = "*"
+DEFAULT_STATION = "köök"
+RECEIPT_ROUTE = "tšekk"
+TICKET_WINDOW = 2.0
+TICKET_MAX_LINES = 40
+TICKET_BACKLOG_LIMIT = 400
+SINK_QUEUE_LIMIT = 64
+SINK_FAILURES_KEPT = 100
+OUTPUT_RETRIES = 4
+RETRY_DELAY = 0.5
+SOCKET_TIMEOUT = 3.0
+
+
+@dataclass
+class OutputDocument:
+    kind: str
+    route: str
+    text: str
+    seq: int = 0
+    created: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+
+class Sink(Protocol):
+    def deliver(self, doc: OutputDocument): ...
+
+
+class SpoolSink:
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    def deliver(self, doc: OutputDocument):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        write_atomic(self.directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{doc.seq:05d}-{doc.kind}.txt", doc.text + "\n")
+
+
+class FileSink:
+    def __init__(self, path: Path):
+        self.path = path
+
+    def deliver(self, doc: OutputDocument):
+        with self.path.open("a", encoding="utf-8") as handle:
+            handle.write(doc.text + "\n\n")
+
+
+class SocketSink:
+    def __init__(self, address: str, timeout: float = SOCKET_TIMEOUT):
+        self.address = address
+        self.timeout = timeout
+
+    def deliver(self, doc: OutputDocument):
+        host, port = parse_address(self.address)
+        if host == "unix":
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(port)
+        else:
+            sock = socket.create_connection((host, port), timeout=self.timeout)
+        with sock:
+            sock.sendall(doc.text.encode("utf-8") + b"\n\f")
+
+
+def make_sink(spec: str) -> Sink:
+    kind, _, target = spec.partition(":")
+    if not target:
+        raise ValueError(f"väljundi kirjeldus {spec!r} on vigane (nt spool:kaust, file:fail.txt, socket:host:port)")
+    if kind == "spool":
+        return SpoolSink(Path(target))
+    if kind == "file":
+        return FileSink(Path(target))
+    if kind == "socket":
+        return SocketSink(target)
+    raise ValueError(f"tundmatu väljundi tüüp {kind!r}")
+
+
+def load_output_routes(path: Path) -> Dict[str, Sink]:
+    routes: Dict[str, Sink] = {}
+    if path.exists():
+        data = json.loads(path.read_text(encoding="utf-8"))
+        for route, spec in data.get("routes", {}).items():
+            routes[route] = make_sink(str(spec))
+    routes.setdefault(DEFAULT_ROUTE, SpoolSink(Path(OUTPUT_SPOOL_DIR)))
+    return routes
+
+
+class SinkWorker:
+    def __init__(self, name: str, sink: Sink, limit: int = SINK_QUEUE_LIMIT, retries: int = OUTPUT_RETRIES, retry_delay: float = RETRY_DELAY):
+        self.name = name
+        self.sink = sink
+        self.limit = limit
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.latency = LatencyHistogram()
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self.rejected = 0
+        self._queue: Deque[OutputDocument] = deque()
+        self._failures: Deque[tuple[OutputDocument, Exception]] = deque(maxlen=SINK_FAILURES_KEPT)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"output-{name}", daemon=True)
+        self._thread.start()
+
+    def offer(self, doc: OutputDocument) -> bool:
+        with self._cond:
+            if self._closed or len(self._queue) >= self.limit:
+                self.rejected += 1
+                return False
+            self._queue.append(doc)
+            self._cond.notify_all()
+            return True
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def take_failures(self) -> List[tuple[OutputDocument, Exception]]:
+        with self._cond:
+            failures = list(self._failures)
+            self._failures.clear()
+        return failures
+
+    def flush(self, timeout: float | None = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue, timeout)
+
+    def close(self, timeout: float | None = 5.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            summary = self.latency.summary()
+            return {
+                "queued": len(self._queue),
+                "delivered": self.delivered,
+                "retried": self.retried,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "p50_ms": summary["p50_ms"],
+                "p95_ms": summary["p95_ms"],
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                doc = self._queue[0]
+            try:
+                self.sink.deliver(doc)
+            except Exception as exc:
+                doc.attempts += 1
+                with self._cond:
+                    if doc.attempts < self.retries and not self._closed:
+                        self.retried += 1
+                        self._cond.wait_for(lambda: self._closed, self.retry_delay * 2 ** (doc.attempts - 1))
+                        continue
+                    self._queue.popleft()
+                    self.failed += 1
+                    self._failures.append((doc, exc))
+                    self._cond.notify_all()
+            else:
+                with self._cond:
+                    self._queue.popleft()
+                    self.delivered += 1
+                    self.latency.record(time.monotonic() - doc.created)
+                    self._cond.notify_all()
+
+
+class OutputPipeline:
+    def __init__(self, routes: Dict[str, Sink], window: float = TICKET_WINDOW):
+        self.window = window
+        self.workers = {route: SinkWorker(route, sink) for route, sink in routes.items()}
+        self.rejected = 0
+        self._batches: Dict[str, List[tuple[int, str, str, int]]] = {}
+        self._due: Dict[str, float] = {}
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="output-tickets", daemon=True)
+        self._thread.start()
+
+    def _worker(self, route: str) -> SinkWorker:
+        return self.workers.get(route) or self.workers[DEFAULT_ROUTE]
+
+    def _document(self, kind: str, route: str, text: str) -> OutputDocument:
+        self._seq += 1
+        return OutputDocument(kind, route, text, self._seq)
+
+    def order(self, table_num: int, guest_id: str, name: str, qty: int, station: str = DEFAULT_STATION) -> bool:
+        with self._cond:
+            if self._closed or len(self._batches.get(station, ())) >= TICKET_BACKLOG_LIMIT:
+                self.rejected += 1
+                return False
+            batch = self._batches.setdefault(station, [])
+            if not batch:
+                self._due[station] = time.monotonic() + self.window
+            batch.append((table_num, guest_id, name, qty))
+            if len(batch) >= TICKET_MAX_LINES:
+                self._due[station] = 0.0
+            self._cond.notify_all()
+            return True
+
+    def receipt(self, text: str) -> bool:
+        with self._cond:
+            doc = self._document("receipt", RECEIPT_ROUTE, text)
+        if self._worker(RECEIPT_ROUTE).offer(doc):
+            return True
+        with self._cond:
+            self.rejected += 1
+        return False
+
+    def _ticket(self, station: str, lines: List[tuple[int, str, str, int]]) -> OutputDocument:
+        merged: Dict[tuple[int, str, str], int] = {}
+        for table_num, guest_id, name, qty in lines:
+            merged[table_num, guest_id, name] = merged.get((table_num, guest_id, name), 0) + qty
+        doc = self._document("ticket", station, "")
+        text = [f"{station.upper()} · pilet {doc.seq} · {time.strftime('%H:%M:%S')}"]
+        table = None
+        for (table_num, guest_id, name), qty in merged.items():
+            if table_num != table:
+                table = table_num
+                text.append(f"Laud {table_num}")
+            text.append(f"  {qty}x {name} ({guest_id})")
+        doc.text = "\n".join(text)
+        return doc
+
+    def _run(self):
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                due = [station for station, deadline in self._due.items() if deadline <= now or self._closed]
+                if not due:
+                    if self._closed:
+                        return
+                    self._cond.wait(min(self._due.values()) - now if self._due else None)
+                    continue
+                for station in due:
+                    lines = self._batches[station]
+                    if self._worker(station).offer(self._ticket(station, lines)):
+                        del self._batches[station], self._due[station]
+                    elif self._closed:
+                        self.rejected += len(lines)
+                        del self._batches[station], self._due[station]
+                    else:
+                        self._due[station] = now + self.window
+                self._cond.notify_all()
+
+    def depth(self) -> int:
+        with self._cond:
+            batched = sum(len(lines) for lines in self._batches.values())
+        return batched + sum(worker.depth() for worker in self.workers.values())
+
+    def take_failures(self) -> List[tuple[str, OutputDocument, Exception]]:
+        return [(name, doc, exc) for name, worker in self.workers.items() for doc, exc in worker.take_failures()]
+
+    def flush(self, timeout: float | None = None) -> bool:
+        with self._cond:
+            for station in self._due:
+                self._due[station] = 0.0
+            self._cond.notify_all()
+            if not self._cond.wait_for(lambda: not self._batches, timeout):
+                return False
+        return all(worker.flush(timeout) for worker in self.workers.values())
+
+    def close(self, timeout: float | None = 5.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        for worker in self.workers.values():
+            worker.close(timeout)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            batched = sum(len(lines) for lines in self._batches.values())
+            rejected = self.rejected
+        return {"batched": batched, "rejected": rejected, "sinks": {name: worker.stats() for name, worker in self.workers.items()}}
@@ -0,0 +1,220 @@
+import bisect
+import csv
+import json
+import operator
+import os
+import struct
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SALES_FILE = "sales_store.bin"
+SALES_ROW = struct.Struct("<dqiiiiB")
+SALES_COLUMNS = (("time", "d"), ("cents", "q"), ("table", "i"), ("waiter", "i"), ("item", "i"), ("qty", "i"), ("method", "B"))
+SALES_MARK = 255
+SALES_DTYPE = [("time", "<f8"), ("cents", "<i8"), ("table", "<i4"), ("waiter", "<i4"), ("item", "<i4"), ("qty", "<i4"), ("method", "u1")]
+DIMENSIONS = ("waiter", "item", "table", "hour", "method")
+DIMENSION_TITLES = {"waiter": "Teenindaja", "item": "Toode", "table": "Laud", "hour": "Tund", "method": "Makseviis"}
+METHOD_TITLES = {"cash": "Sularaha", "card": "Kaart"}
+KEY_ORDERED = ("table", "hour")
+REPORT_PERIODS = {"Täna": (0, 1), "Eile": (1, 1), "7 päeva": (6, 7), "30 päeva": (29, 30), "Kõik": None}
+
+
+def period_bounds(name: str, now: datetime | None = None) -> tuple[float | None, float | None]:
+    period = REPORT_PERIODS[name]
+    if period is None:
+        return None, None
+    back, days = period
+    midnight = (now or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=back)
+    return midnight.timestamp(), (midnight + timedelta(days=days)).timestamp()
+
+
+def _group(dimension: str, labels: List[str], totals: Dict[int, List[int]]) -> List[List]:
+    if dimension == "table":
+        rows = [[str(key), qty, cents] for key, (qty, cents) in totals.items()]
+    elif dimension == "hour":
+        rows = [[f"{key:02d}:00", qty, cents] for key, (qty, cents) in totals.items()]
+    elif dimension == "method":
+        rows = [[METHOD_TITLES.get(labels[key], labels[key]), qty, cents] for key, (qty, cents) in totals.items()]
+    else:
+        rows = [[labels[key], qty, cents] for key, (qty, cents) in totals.items()]
+    if dimension in KEY_ORDERED:
+        rows.sort(key=lambda row: row[0])
+    else:
+        rows.sort(key=lambda row: (-row[2], row[0]))
+    return rows
+
+
+def _totals_numpy(columns: Dict[str, array], utc_offset: int) -> Dict[str, Dict[int, List[int]]]:
+    qty = np.frombuffer(columns["qty"], dtype=np.int32).astype(np.int64)
+    revenue = qty * np.frombuffer(columns["cents"], dtype=np.int64)
+    hours = ((np.frombuffer(columns["time"], dtype=np.float64) + utc_offset) // 3600 % 24).astype(np.int64)
+    keys = {"waiter": columns["waiter"], "item": columns["item"], "table": columns["table"], "method": columns["method"]}
+    result = {}
+    for dimension in DIMENSIONS:
+        codes = hours if dimension == "hour" else np.frombuffer(keys[dimension], dtype=np.uint8 if dimension == "method" else np.int32)
+        values, inverse = np.unique(codes, return_inverse=True)
+        counts = np.bincount(inverse, weights=qty, minlength=len(values))
+        sums = np.bincount(inverse, weights=revenue, minlength=len(values))
+        result[dimension] = {int(key): [int(round(count)), int(round(cents))] for key, count, cents in zip(values, counts, sums)}
+    return result
+
+
+def _totals_python(columns: Dict[str, array], utc_offset: int) -> Dict[str, Dict[int, List[int]]]:
+    qty = columns["qty"]
+    revenue = list(map(operator.mul, qty, columns["cents"]))
+    keys = {"waiter": columns["waiter"], "item": columns["item"], "table": columns["table"], "method": columns["method"]}
+    keys["hour"] = array("B", [int((stamp + utc_offset) // 3600 % 24) for stamp in columns["time"]])
+    result = {}
+    for dimension in DIMENSIONS:
+        codes = keys[dimension]
+        size = max(codes) + 1 if codes else 0
+        counts, sums = [0] * size, [0] * size
+        for code, count, cents in zip(codes, qty, revenue):
+            counts[code] += count
+            sums[code] += cents
+        result[dimension] = {code: [counts[code], sums[code]] for code in range(size) if counts[code] or sums[code]}
+    return result
+
+
+def build_report(columns: Dict[str, array], labels: Dict[str, List[str]], utc_offset: int = 0) -> Dict:
+    totals = (_totals_numpy if np is not None and len(columns["time"]) else _totals_python)(columns, utc_offset)
+    return {
+        "lines": len(columns["time"]),
+        "qty": sum(qty for qty, _ in totals["method"].values()),
+        "cents": sum(cents for _, cents in totals["method"].values()),
+        "groups": {dimension: _group(dimension, labels.get(dimension, []), totals[dimension]) for dimension in DIMENSIONS},
+    }
+
+
+def export_csv(report: Dict, path: Path):
+    with path.open("w", encoding="utf-8-sig", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["rühm", "väärtus", "kogus", "summa"])
+        for dimension in DIMENSIONS:
+            for label, qty, cents in report["groups"][dimension]:
+                writer.writerow([DIMENSION_TITLES[dimension], label, qty, f"{cents / 100:.2f}"])
+        writer.writerow(["Kokku", "", report["qty"], f"{report['cents'] / 100:.2f}"])
+
+
+class SalesStore:
+    def __init__(self, path: Path | None = None):
+        self.path = path
+        self.names_path = path.with_suffix(".names") if path is not None else None
+        self.columns: Dict[str, array] = {name: array(code) for name, code in SALES_COLUMNS}
+        self.labels: Dict[str, List[str]] = {"waiter": [], "item": [], "method": []}
+        self._codes: Dict[str, Dict[str, int]] = {kind: {} for kind in self.labels}
+        self.last_seq = 0
+        self._lock = threading.Lock()
+        self._rows = None
+        self._names = None
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self.columns["time"])
+
+    def open(self) -> "SalesStore":
+        if self.path is None:
+            return self
+        names = self.names_path.read_text(encoding="utf-8") if self.names_path.exists() else ""
+        for line in names.splitlines():
+            try:
+                kind, key, label = json.loads(line)
+            except ValueError:
+                continue
+            self._define(kind, key, label)
+        data = self.path.read_bytes() if self.path.exists() else b""
+        usable = len(data) - len(data) % SALES_ROW.size
+        if np is not None:
+            rows = np.frombuffer(data, dtype=np.dtype(SALES_DTYPE), count=usable // SALES_ROW.size)
+            marks = rows["method"] == SALES_MARK
+            if marks.any():
+                self.last_seq = int(rows["cents"][marks].max())
+                rows = rows[~marks]
+            for name, code in SALES_COLUMNS:
+                self.columns[name] = array(code, rows[name].tobytes())
+        elif usable:
+            rows = []
+            for row in SALES_ROW.iter_unpack(data[:usable]):
+                if row[6] == SALES_MARK:
+                    self.last_seq = max(self.last_seq, row[1])
+                else:
+                    rows.append(row)
+            for (name, code), values in zip(SALES_COLUMNS, zip(*rows)):
+                self.columns[name] = array(code, values)
+        self._rows = self.path.open("ab")
+        if usable != len(data):
+            self._rows.truncate(usable)
+        self._names = self.names_path.open("a", encoding="utf-8")
+        if names and not names.endswith("\n"):
+            self._names.write("\n")
+        return self
+
+    def _define(self, kind: str, key: str, label: str) -> int:
+        code = self._codes[kind][key] = len(self.labels[kind])
+        self.labels[kind].append(label)
+        return code
+
+    def _code(self, kind: str, key: str, label: str) -> int:
+        code = self._codes[kind].get(key)
+        if code is None:
+            code = self._define(kind, key, label)
+            if self._names is not None:
+                self._names.write(json.dumps([kind, key, label], ensure_ascii=False) + "\n")
+                self._names.flush()
+        return code
+
+    def record(self, table_num: int, waiter: str, method: str, lines: Iterable[tuple[str, str, int, int]], when: float | None = None, seq: int = 0):
+        with self._lock:
+            times = self.columns["time"]
+            stamp = time.time() if when is None else when
+            if times and stamp < times[-1]:
+                stamp = times[-1]
+            waiter_code = self._code("waiter", waiter, waiter)
+            method_code = self._code("method", method, method)
+            rows = [(stamp, cents, table_num, waiter_code, self._code("item", item_id or name, name), qty, method_code) for item_id, name, qty, cents in lines]
+            for row in rows:
+                for (name, _), value in zip(SALES_COLUMNS, row):
+                    self.columns[name].append(value)
+            if seq and rows:
+                self.last_seq = max(self.last_seq, seq)
+            if self._rows is not None and rows:
+                mark = [SALES_ROW.pack(0.0, seq, 0, 0, 0, 0, SALES_MARK)] if seq else []
+                self._rows.write(b"".join([SALES_ROW.pack(*row) for row in rows] + mark))
+                self._rows.flush()
+                self._dirty = True
+
+    def report(self, start: float | None = None, end: float | None = None) -> Dict:
+        with self._lock:
+            times = self.columns["time"]
+            low = 0 if start is None else bisect.bisect_left(times, start)
+            high = len(times) if end is None else bisect.bisect_left(times, end)
+            columns = {name: column[low:high] for name, column in self.columns.items()}
+            labels = {kind: list(values) for kind, values in self.labels.items()}
+        offset = time.localtime(start if start is not None else time.time()).tm_gmtoff
+        return build_report(columns, labels, offset)
+
+    def sync(self):
+        with self._lock:
+            if self._dirty:
+                os.fsync(self._rows.fileno())
+                self._dirty = False
+
+    def close(self):
+        with self._lock:
+            for handle in (self._rows, self._names):
+                if handle is not None:
+                    handle.close()
+            self._rows = self._names = None
+            self._dirty = False
+
+    def stats(self) -> Dict:
+        return {"lines": len(self), "items": len(self.labels["item"]), "waiters": len(self.labels["waiter"]), "numpy": np is not None}
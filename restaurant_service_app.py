@@ -1,82 +1,972 @@
+import argparse
+import bisect
+import csv
+import hashlib
+import io
 import json
+import math
+import mmap
+import re
+import struct
+import sys
+import time
 import tkinter as tk
-from dataclasses import dataclass
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
 from tkinter import filedialog, messagebox, simpledialog, ttk
-from typing import Dict, List
+from typing import Callable, Dict, Hashable, Iterable, List, Set
+
+from restaurant_auth import (
+    CODES_FILE,
+    PERM_ALL_TABLES,
+    PERM_CODES,
+    PERM_DIAGNOSTICS,
+    PERM_LAYOUT,
+    PERM_REPORTS,
+    ROLE_PERMISSIONS,
+    CredentialStore,
+    LoginThrottled,
+    Principal,
+)
+from restaurant_core import (
+    JOURNAL_SYNC_SECONDS,
+    TABLE_CLAIMED,
+    AccessDenied,
+    CoreClient,
+    CoreError,
+    OrderItem,
+    PersistenceWorker,
+    RestaurantCore,
+    TableData,
+    VersionConflict,
+    open_local_core,
+    to_cents,
+)
+from restaurant_menu import MENU_FILE, MenuCatalog, MenuItem
+from restaurant_metrics import METRICS
+from restaurant_output import DEFAULT_ROUTE, DEFAULT_STATION, OUTPUT_CONFIG_FILE, OUTPUT_SPOOL_DIR, OutputPipeline, SpoolSink, load_output_routes
+from restaurant_sales import DIMENSION_TITLES, DIMENSIONS, REPORT_PERIODS, export_csv, period_bounds
 
 APP_TITLE = "Lauateeninduse Süsteem"
 DEFAULT_LAYOUT_FILE = "table_layout.json"
-CODES_FILE = "access_codes.json"
-SUPER_CODE = "0000"
 BASE_UNIT = 36
 MIN_TABLE_SIDE = 80
 SEAT_RADIUS = 12
 SEAT_OFFSET = 24
+GRID_CELL = 128
+FRAME_BUDGET_MS = 12
+MIN_ZOOM = 0.1
+MAX_ZOOM = 4.0
+LABEL_ZOOM = 0.35
+SEAT_ZOOM = 0.6
+DEFAULT_FLOOR = "1"
+SPRITE_CACHE_SIZE = 96
+LAYOUT_CACHE_MAGIC = b"RSLAYOUT"
+LAYOUT_CACHE_VERSION = 1
+LAYOUT_CACHE_HEADER = struct.Struct("<8sHHBxxxIqq32sI")
+LAYOUT_CACHE_SECTIONS = (
+    ("numbers", "i"),
+    ("centers", "i"),
+    ("sides", "B"),
+    ("floor_ids", "H"),
+    ("bounds", "i"),
+    ("seat_start", "i"),
+    ("seats", "d"),
+    ("seat_table", "i"),
+    ("table_cells", "q"),
+    ("table_cell_start", "i"),
+    ("table_members", "i"),
+    ("seat_cells", "q"),
+    ("seat_cell_start", "i"),
+    ("seat_members", "i"),
+)
+LAYOUT_CACHE_COUNTS = struct.Struct("<" + "I" * len(LAYOUT_CACHE_SECTIONS))
+CELL_BIAS = 1 << 20
+SIDE_NAMES = ("up", "right", "down", "left")
+MAX_SIDE_SEATS = 100
+TEMPLATE_GAP = 40
+MOVE_STEP = 10
+GRID_TEMPLATE = re.compile(
+    r"^\s*(\d+)\s*[x×]\s*(\d+)\s+(\d+)(?:-kohta|-top)?\s*@\s*(-?\d+)\s*,\s*(-?\d+)"
+    r"(?:\s+samm\s+(\d+)\s*,\s*(\d+))?(?:\s+nr\s+(\d+))?(?:\s+korrus\s+(\S+))?\s*$",
+    re.IGNORECASE,
+)
+DIGIT_GLYPHS = {
+    "0": ("111", "101", "101", "101", "111"),
+    "1": ("010", "110", "010", "010", "111"),
+    "2": ("111", "001", "111", "100", "111"),
+    "3": ("111", "001", "111", "001", "111"),
+    "4": ("101", "101", "111", "001", "001"),
+    "5": ("111", "100", "111", "001", "111"),
+    "6": ("111", "100", "111", "101", "111"),
+    "7": ("111", "001", "010", "010", "010"),
+    "8": ("111", "101", "111", "101", "111"),
+    "9": ("111", "101", "111", "001", "111"),
+}
+
+
+def sides_key(sides: Dict[str, int]) -> tuple[int, int, int, int]:
+    return sides["up"], sides["right"], sides["down"], sides["left"]
+
+
+@lru_cache(maxsize=None)
+def _table_size(key: tuple[int, int, int, int]) -> tuple[int, int]:
+    up, right, down, left = key
+    width = max(MIN_TABLE_SIDE, max(1, max(up, down)) * BASE_UNIT)
+    height = max(MIN_TABLE_SIDE, max(1, max(left, right)) * BASE_UNIT)
+    return width, height
+
+
+def table_size(sides: Dict[str, int]) -> tuple[int, int]:
+    return _table_size(sides_key(sides))
+
+
+def table_bounds(entry: Dict) -> tuple[int, int, int, int]:
+    cx, cy = entry["center"]["x"], entry["center"]["y"]
+    w, h = _table_size(sides_key(entry["sides"]))
+    return cx - w // 2, cy - h // 2, cx + w // 2, cy + h // 2
+
+
+@lru_cache(maxsize=None)
+def seat_offsets(key: tuple[int, int, int, int]) -> tuple[tuple[float, float, int], ...]:
+    up, right, down, left = key
+    w, h = _table_size(key)
+    x0, y0, x1, y1 = -(w // 2), -(h // 2), w // 2, h // 2
+    points: List[tuple[float, float, int]] = []
+    seat_number = 1
+
+    def spread(start: float, end: float, count: int):
+        if count <= 0:
+            return []
+        step = (end - start) / (count + 1)
+        return [start + step * (i + 1) for i in range(count)]
+
+    for x in spread(x0, x1, up):
+        points.append((x, y0 - SEAT_OFFSET, seat_number)); seat_number += 1
+    for y in spread(y0, y1, right):
+        points.append((x1 + SEAT_OFFSET, y, seat_number)); seat_number += 1
+    for x in reversed(spread(x0, x1, down)):
+        points.append((x, y1 + SEAT_OFFSET, seat_number)); seat_number += 1
+    for y in reversed(spread(y0, y1, left)):
+        points.append((x0 - SEAT_OFFSET, y, seat_number)); seat_number += 1
+    return tuple(points)
+
+
+def seat_points(entry: Dict) -> List[tuple[float, float, int]]:
+    cx, cy = entry["center"]["x"], entry["center"]["y"]
+    return [(cx + dx, cy + dy, n) for dx, dy, n in seat_offsets(sides_key(entry["sides"]))]
+
+
+def table_floor(entry: Dict) -> str:
+    return str(entry.get("floor", DEFAULT_FLOOR))
+
+
+def table_footprint(entry: Dict) -> tuple[int, int, int, int]:
+    left, top, right, bottom = table_bounds(entry)
+    sides = entry["sides"]
+    reach = SEAT_OFFSET + SEAT_RADIUS
+    return (
+        left - (reach if sides["left"] else 0),
+        top - (reach if sides["up"] else 0),
+        right + (reach if sides["right"] else 0),
+        bottom + (reach if sides["down"] else 0),
+    )
+
+
+def rects_overlap(a: tuple, b: tuple) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def grid_cells(bounds: tuple, size: int = GRID_CELL):
+    left, top, right, bottom = bounds
+    for cx in range(int(left // size), int(right // size) + 1):
+        for cy in range(int(top // size), int(bottom // size) + 1):
+            yield cx, cy
+
+
+def pack_cell(floor_index: int, cell: tuple[int, int]) -> int:
+    return (floor_index << 42) | ((cell[0] + CELL_BIAS) << 21) | (cell[1] + CELL_BIAS)
+
+
+class SpatialGrid:
+    def __init__(self, cell_size: int = GRID_CELL):
+        self.cell_size = cell_size
+        self._cells: Dict[tuple[int, int], Set[Hashable]] = {}
+        self._bounds: Dict[Hashable, tuple] = {}
+        self._source: "CompiledCells | None" = None
+        self._loaded: Set[tuple[int, int]] = set()
+        self._dropped: Set[Hashable] = set()
+
+    def __len__(self) -> int:
+        if self._source is None:
+            return len(self._bounds)
+        return len(self._bounds) + len(self._source) - len(self._dropped)
 
+    def attach(self, source: "CompiledCells"):
+        self.clear()
+        self._source = source
+
+    def _cells_for(self, bounds: tuple):
+        return grid_cells(bounds, self.cell_size)
+
+    def _bucket(self, cell: tuple[int, int]) -> Set[Hashable] | None:
+        bucket = self._cells.get(cell)
+        if bucket is None and self._source is not None and cell not in self._loaded:
+            self._loaded.add(cell)
+            keys = [key for key in self._source.lookup(cell) if key not in self._dropped]
+            if keys:
+                bucket = self._cells[cell] = set(keys)
+        return bucket
+
+    def _bounds_of(self, key: Hashable) -> tuple | None:
+        bounds = self._bounds.get(key)
+        if bounds is None and self._source is not None and key not in self._dropped and key in self._source:
+            bounds = self._source.bounds(key)
+        return bounds
+
+    def insert(self, key: Hashable, bounds: tuple):
+        self.remove(key)
+        self._bounds[key] = bounds
+        for cell in self._cells_for(bounds):
+            bucket = self._bucket(cell)
+            if bucket is None:
+                bucket = self._cells[cell] = set()
+            bucket.add(key)
+
+    def remove(self, key: Hashable):
+        bounds = self._bounds_of(key)
+        if bounds is None:
+            return
+        for cell in self._cells_for(bounds):
+            bucket = self._bucket(cell)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._cells[cell]
+        self._bounds.pop(key, None)
+        if self._source is not None and key in self._source:
+            self._dropped.add(key)
+
+    def clear(self):
+        self._cells.clear()
+        self._bounds.clear()
+        self._source = None
+        self._loaded.clear()
+        self._dropped.clear()
+
+    def bounds(self, key: Hashable) -> tuple | None:
+        return self._bounds_of(key)
+
+    def query_point(self, x: float, y: float) -> List[Hashable]:
+        bucket = self._bucket((int(x // self.cell_size), int(y // self.cell_size))) or ()
+        hits = []
+        for key in bucket:
+            left, top, right, bottom = self._bounds_of(key)
+            if left <= x <= right and top <= y <= bottom:
+                hits.append(key)
+        return hits
+
+    def query_rect(self, bounds: tuple) -> Set[Hashable]:
+        hits: Set[Hashable] = set()
+        for cell in self._cells_for(bounds):
+            for key in self._bucket(cell) or ():
+                if key not in hits and rects_overlap(bounds, self._bounds_of(key)):
+                    hits.add(key)
+        return hits
+
+
+def layout_cache_path(path: Path) -> Path:
+    return path.with_name(path.name + ".cache")
+
+
+def parse_layout(data: bytes) -> Dict[int, Dict]:
+    layout = {}
+    for key, raw in json.loads(data).get("tables", {}).items():
+        raw.pop("owner", None)
+        try:
+            entry = table_entry(raw["center"]["x"], raw["center"]["y"], raw["sides"], raw.get("floor"))
+        except (KeyError, TypeError, ValueError) as exc:
+            raise ValueError(f"laud {key}: {exc}") from exc
+        layout[int(key)] = {**raw, **entry}
+    return layout
+
+
+def table_entry(x: float, y: float, sides: Dict[str, int], floor: str | None = None) -> Dict:
+    sides = {side: int(sides[side]) for side in SIDE_NAMES}
+    if any(seats < 0 for seats in sides.values()):
+        raise ValueError("istekohtade arv ei saa olla negatiivne")
+    if any(seats > MAX_SIDE_SEATS for seats in sides.values()):
+        raise ValueError(f"ühel küljel saab olla kuni {MAX_SIDE_SEATS} istekohta")
+    if sum(sides.values()) == 0:
+        raise ValueError("laual peab olema vähemalt 1 istekoht")
+    entry = {"center": {"x": round(float(x)), "y": round(float(y))}, "sides": sides}
+    if floor:
+        entry["floor"] = str(floor)
+    return entry
+
+
+def seats_to_sides(seats: int) -> Dict[str, int]:
+    return {"up": (seats + 1) // 2, "right": 0, "down": seats // 2, "left": 0}
+
+
+def _import_row(row: Dict) -> tuple[int, Dict]:
+    if "center" in row:
+        return int(row["number"]), table_entry(int(row["center"]["x"]), int(row["center"]["y"]), row["sides"], row.get("floor"))
+    if row.get("seats") not in (None, ""):
+        sides = seats_to_sides(int(row["seats"]))
+    else:
+        sides = {side: int(row.get(side) or 0) for side in SIDE_NAMES}
+    return int(row["number"]), table_entry(int(float(row["x"])), int(float(row["y"])), sides, row.get("floor"))
+
+
+def parse_tables(text: str, fmt: str) -> Dict[int, Dict]:
+    if fmt == "json":
+        data = json.loads(text)
+        if isinstance(data, dict):
+            rows = [dict(entry, number=number) for number, entry in data.get("tables", {}).items()]
+        else:
+            rows = data
+        start = 1
+    else:
+        rows = list(csv.DictReader(io.StringIO(text), skipinitialspace=True))
+        start = 2
+    tables: Dict[int, Dict] = {}
+    for line, row in enumerate(rows, start):
+        try:
+            number, entry = _import_row({str(k).strip().lower(): v for k, v in row.items() if k is not None})
+        except KeyError as exc:
+            raise ValueError(f"Rida {line}: puudub väli {exc}") from exc
+        except (TypeError, ValueError, AttributeError) as exc:
+            raise ValueError(f"Rida {line}: {exc}") from exc
+        if number < 1:
+            raise ValueError(f"Rida {line}: laua number peab olema positiivne")
+        if number in tables:
+            raise ValueError(f"Rida {line}: laud {number} on failis mitu korda")
+        tables[number] = entry
+    return tables
+
+
+def grid_template(text: str, first_number: int) -> Dict[int, Dict]:
+    match = GRID_TEMPLATE.match(text)
+    if match is None:
+        raise ValueError("Mall peab olema kujul 'RIDAxVEERG KOHTI @ X,Y [samm DX,DY] [nr N] [korrus K]', nt '5x4 4 @ 100,100'.")
+    rows, cols, seats, x, y, step_x, step_y, number, floor = match.groups()
+    sides = seats_to_sides(int(seats))
+    left, top, right, bottom = table_footprint(table_entry(0, 0, sides))
+    step_x = int(step_x) if step_x else right - left + TEMPLATE_GAP
+    step_y = int(step_y) if step_y else bottom - top + TEMPLATE_GAP
+    number = int(number) if number else first_number
+    tables = {}
+    for row in range(int(rows)):
+        for col in range(int(cols)):
+            tables[number] = table_entry(int(x) + col * step_x, int(y) + row * step_y, sides, floor)
+            number += 1
+    return tables
+
+
+def layout_conflicts(layout: Dict[int, Dict], entries: Dict[int, Dict]) -> List[tuple[int, int]]:
+    floors = {table_floor(entry) for entry in entries.values()}
+    grids: Dict[str, SpatialGrid] = {floor: SpatialGrid() for floor in floors}
+    for table_num, entry in layout.items():
+        grid = grids.get(table_floor(entry))
+        if grid is not None and table_num not in entries:
+            grid.insert(table_num, table_footprint(entry))
+    conflicts = []
+    for table_num, entry in sorted(entries.items()):
+        grid = grids[table_floor(entry)]
+        area = table_footprint(entry)
+        conflicts.extend((table_num, other) for other in sorted(grid.query_rect(area)))
+        grid.insert(table_num, area)
+    return conflicts
+
+
+def compile_layout(path: Path) -> bytes:
+    stat = path.stat()
+    data = path.read_bytes()
+    layout = parse_layout(data)
+    floors = sorted({table_floor(entry) for entry in layout.values()})
+    floor_ids = {floor: index for index, floor in enumerate(floors)}
+    sections = {name: array(code) for name, code in LAYOUT_CACHE_SECTIONS}
+    meta: Dict = {"floors": floors, "explicit_floor": [], "extra": {}}
+    table_cells: Dict[int, List[int]] = {}
+    seat_cells: Dict[int, List[int]] = {}
+    for row, table_num in enumerate(sorted(layout)):
+        entry = layout[table_num]
+        floor_index = floor_ids[table_floor(entry)]
+        bounds = table_bounds(entry)
+        sections["numbers"].append(table_num)
+        sections["centers"].extend((entry["center"]["x"], entry["center"]["y"]))
+        sections["sides"].extend(sides_key(entry["sides"]))
+        sections["floor_ids"].append(floor_index)
+        sections["bounds"].extend(bounds)
+        sections["seat_start"].append(len(sections["seat_table"]))
+        for cell in grid_cells(bounds):
+            table_cells.setdefault(pack_cell(floor_index, cell), []).append(row)
+        for x, y, _n in seat_points(entry):
+            seat_row = len(sections["seat_table"])
+            sections["seats"].extend((x, y))
+            sections["seat_table"].append(row)
+            for cell in grid_cells((x - SEAT_RADIUS, y - SEAT_RADIUS, x + SEAT_RADIUS, y + SEAT_RADIUS)):
+                seat_cells.setdefault(pack_cell(floor_index, cell), []).append(seat_row)
+        if "floor" in entry:
+            meta["explicit_floor"].append(row)
+        extra = {key: value for key, value in entry.items() if key not in ("center", "sides", "floor")}
+        if extra:
+            meta["extra"][str(row)] = extra
+    sections["seat_start"].append(len(sections["seat_table"]))
+    for prefix, cells in (("table", table_cells), ("seat", seat_cells)):
+        for packed in sorted(cells):
+            sections[f"{prefix}_cells"].append(packed)
+            sections[f"{prefix}_cell_start"].append(len(sections[f"{prefix}_members"]))
+            sections[f"{prefix}_members"].extend(cells[packed])
+        sections[f"{prefix}_cell_start"].append(len(sections[f"{prefix}_members"]))
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    header = LAYOUT_CACHE_HEADER.pack(
+        LAYOUT_CACHE_MAGIC, LAYOUT_CACHE_VERSION, GRID_CELL, sys.byteorder == "little",
+        len(layout), stat.st_mtime_ns, stat.st_size, hashlib.sha256(data).digest(), len(meta_bytes),
+    )
+    chunks = [header, LAYOUT_CACHE_COUNTS.pack(*(len(sections[name]) for name, _ in LAYOUT_CACHE_SECTIONS)), meta_bytes]
+    offset = sum(map(len, chunks))
+    for name, _code in LAYOUT_CACHE_SECTIONS:
+        chunks.append(bytes(-offset % 8))
+        chunks.append(sections[name].tobytes())
+        offset += len(chunks[-2]) + len(chunks[-1])
+    return b"".join(chunks)
+
+
+class CompiledLayout:
+    def __init__(self, meta: Dict, sections: Dict[str, array], stale: bool = False):
+        self.floors: List[str] = meta["floors"]
+        self.explicit_floor = set(meta["explicit_floor"])
+        self.extra: Dict[str, Dict] = meta["extra"]
+        self.stale = stale
+        for name, values in sections.items():
+            setattr(self, name, values)
+        self.rows = {table_num: row for row, table_num in enumerate(self.numbers)}
+
+    @classmethod
+    def open(cls, path: Path) -> "CompiledLayout | None":
+        try:
+            stat = path.stat()
+            with layout_cache_path(path).open("rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                magic, version, cell, little, _count, mtime_ns, size, digest, meta_len = LAYOUT_CACHE_HEADER.unpack_from(mapped, 0)
+                if (magic, version, cell, bool(little)) != (LAYOUT_CACHE_MAGIC, LAYOUT_CACHE_VERSION, GRID_CELL, sys.byteorder == "little"):
+                    return None
+                stale = (mtime_ns, size) != (stat.st_mtime_ns, stat.st_size)
+                if stale and hashlib.sha256(path.read_bytes()).digest() != digest:
+                    return None
+                offset = LAYOUT_CACHE_HEADER.size
+                counts = LAYOUT_CACHE_COUNTS.unpack_from(mapped, offset)
+                offset += LAYOUT_CACHE_COUNTS.size
+                meta = json.loads(mapped[offset:offset + meta_len].decode("utf-8"))
+                offset += meta_len
+                sections = {}
+                with memoryview(mapped) as view:
+                    for (name, code), count in zip(LAYOUT_CACHE_SECTIONS, counts):
+                        offset += -offset % 8
+                        values = array(code)
+                        values.frombytes(view[offset:offset + count * values.itemsize])
+                        offset += count * values.itemsize
+                        sections[name] = values
+        except (OSError, ValueError, struct.error, KeyError):
+            return None
+        return cls(meta, sections, stale)
+
+    def entries(self) -> Dict[int, Dict]:
+        centers, sides = self.centers, self.sides
+        layout = {}
+        for row, table_num in enumerate(self.numbers):
+            c, k = 2 * row, 4 * row
+            layout[table_num] = {
+                "center": {"x": centers[c], "y": centers[c + 1]},
+                "sides": {"up": sides[k], "right": sides[k + 1], "down": sides[k + 2], "left": sides[k + 3]},
+            }
+        for row in self.explicit_floor:
+            layout[self.numbers[row]]["floor"] = self.floors[self.floor_ids[row]]
+        for row, extra in self.extra.items():
+            layout[self.numbers[int(row)]].update(extra)
+        return layout
+
+    def floor_tables(self) -> Dict[str, List[int]]:
+        tables: Dict[str, List[int]] = {}
+        for table_num, floor_index in zip(self.numbers, self.floor_ids):
+            tables.setdefault(self.floors[floor_index], []).append(table_num)
+        return tables
+
+    def floor_index(self, floor: str) -> tuple[SpatialGrid, SpatialGrid, Dict[int, int]]:
+        table_index, seat_index = SpatialGrid(), SpatialGrid()
+        seat_counts: Dict[int, int] = {}
+        if floor in self.floors:
+            index = self.floors.index(floor)
+            table_index.attach(CompiledCells(self, index, seats=False))
+            seat_index.attach(CompiledCells(self, index, seats=True))
+            start = self.seat_start
+            for row, table_num in enumerate(self.numbers):
+                if self.floor_ids[row] == index:
+                    seat_counts[table_num] = start[row + 1] - start[row]
+        return table_index, seat_index, seat_counts
+
+
+class CompiledCells:
+    def __init__(self, layout: CompiledLayout, floor_index: int, seats: bool):
+        self.layout = layout
+        self.floor_index = floor_index
+        self.seats = seats
+        prefix = "seat" if seats else "table"
+        self.cells: array = getattr(layout, f"{prefix}_cells")
+        self.starts: array = getattr(layout, f"{prefix}_cell_start")
+        self.members: array = getattr(layout, f"{prefix}_members")
+        floors = layout.floor_ids
+        rows = [row for row in range(len(floors)) if floors[row] == floor_index]
+        start = layout.seat_start
+        self.count = sum(start[row + 1] - start[row] for row in rows) if seats else len(rows)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, key: Hashable) -> bool:
+        layout = self.layout
+        if self.seats:
+            table_num, n = key
+            row = layout.rows.get(table_num)
+            return row is not None and layout.floor_ids[row] == self.floor_index and 1 <= n <= layout.seat_start[row + 1] - layout.seat_start[row]
+        row = layout.rows.get(key)
+        return row is not None and layout.floor_ids[row] == self.floor_index
+
+    def lookup(self, cell: tuple[int, int]) -> List[Hashable]:
+        packed = pack_cell(self.floor_index, cell)
+        index = bisect.bisect_left(self.cells, packed)
+        if index == len(self.cells) or self.cells[index] != packed:
+            return []
+        members = self.members[self.starts[index]:self.starts[index + 1]]
+        layout = self.layout
+        if not self.seats:
+            return [layout.numbers[row] for row in members]
+        keys = []
+        for seat_row in members:
+            row = layout.seat_table[seat_row]
+            keys.append((layout.numbers[row], seat_row - layout.seat_start[row] + 1))
+        return keys
+
+    def bounds(self, key: Hashable) -> tuple:
+        layout = self.layout
+        if self.seats:
+            table_num, n = key
+            seat_row = layout.seat_start[layout.rows[table_num]] + n - 1
+            x, y = layout.seats[2 * seat_row], layout.seats[2 * seat_row + 1]
+            return x - SEAT_RADIUS, y - SEAT_RADIUS, x + SEAT_RADIUS, y + SEAT_RADIUS
+        row = layout.rows[key]
+        return tuple(layout.bounds[4 * row:4 * row + 4])
+
+
+class SpriteCache:
+    def __init__(self, factory: Callable[[int, int], tk.PhotoImage], capacity: int = SPRITE_CACHE_SIZE):
+        self.factory = factory
+        self.capacity = capacity
+        self._entries: "OrderedDict[tuple, list]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def acquire(self, key: tuple) -> tk.PhotoImage:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            entry = self._entries[key] = [self._render(*key), 0]
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        entry[1] += 1
+        self._evict()
+        return entry[0]
+
+    def release(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry[1] -= 1
+
+    def _evict(self):
+        if len(self._entries) <= self.capacity:
+            return
+        for key in [key for key, entry in self._entries.items() if entry[1] <= 0]:
+            del self._entries[key]
+            if len(self._entries) <= self.capacity:
+                return
 
-@dataclass
-class OrderItem:
-    guest_id: str
-    name: str
-    qty: int
-    unit_price: float
-
-    @property
-    def total(self) -> float:
-        return self.qty * self.unit_price
-
-
-class TableData:
-    def __init__(self, table_number: int):
-        self.table_number = table_number
-        self.guests: Dict[str, List[OrderItem]] = {}
-
-    def add_guest(self, guest_id: str):
-        if guest_id not in self.guests:
-            self.guests[guest_id] = []
-
-    def add_order(self, item: OrderItem):
-        self.add_guest(item.guest_id)
-        self.guests[item.guest_id].append(item)
-
-    def total(self) -> float:
-        return sum(item.total for items in self.guests.values() for item in items)
-
-    def guest_total(self, guest_id: str) -> float:
-        return round(sum(item.total for item in self.guests.get(guest_id, [])), 2)
-
-    def totals_by_guest(self) -> Dict[str, float]:
-        return {guest: self.guest_total(guest) for guest in self.guests}
-
-    def has_unpaid(self) -> bool:
-        return any(self.guest_total(guest) > 0 for guest in self.guests)
-
-    def mark_guest_paid(self, guest_id: str):
-        if guest_id in self.guests:
-            self.guests[guest_id] = []
+    def _render(self, sides: tuple[int, int, int, int], fill: str, scale: float) -> tk.PhotoImage:
+        w, h = _table_size(sides)
+        reach = SEAT_OFFSET + SEAT_RADIUS
+        half_w = math.ceil((w // 2 + reach) * scale)
+        half_h = math.ceil((h // 2 + reach) * scale)
+        image = self.factory(2 * half_w + 1, 2 * half_h + 1)
+
+        def box(x0: float, y0: float, x1: float, y1: float, color: str):
+            x0, y0 = max(0, round(x0)), max(0, round(y0))
+            x1, y1 = min(2 * half_w + 1, round(x1)), min(2 * half_h + 1, round(y1))
+            if x1 > x0 and y1 > y0:
+                image.put(color, to=(x0, y0, x1, y1))
+
+        def disc(cx: float, cy: float, radius: float, color: str):
+            for row in range(-math.floor(radius), math.floor(radius) + 1):
+                span = math.sqrt(max(0.0, radius * radius - row * row))
+                box(cx - span, cy + row, cx + span + 1, cy + row + 1, color)
+
+        border = max(1, round(2 * scale))
+        box(half_w - w // 2 * scale, half_h - h // 2 * scale, half_w + w // 2 * scale + 1, half_h + h // 2 * scale + 1, "#0b3d91")
+        box(half_w - w // 2 * scale + border, half_h - h // 2 * scale + border, half_w + w // 2 * scale + 1 - border, half_h + h // 2 * scale + 1 - border, fill)
+        radius = SEAT_RADIUS * scale
+        pixel = max(1, round(1.6 * scale))
+        for dx, dy, n in seat_offsets(sides):
+            cx, cy = half_w + dx * scale, half_h + dy * scale
+            disc(cx, cy, radius, "#8a5b00")
+            disc(cx, cy, radius - 1, "#ffd166")
+            text = str(n)
+            left = cx - (len(text) * 4 - 1) * pixel / 2
+            top = cy - 5 * pixel / 2
+            for index, char in enumerate(text):
+                for row, bits in enumerate(DIGIT_GLYPHS[char]):
+                    for col, bit in enumerate(bits):
+                        if bit == "1":
+                            x = left + (index * 4 + col) * pixel
+                            y = top + row * pixel
+                            box(x, y, x + pixel, y + pixel, "#000000")
+        return image
+
+
+class MapRenderer:
+    def __init__(self, canvas: tk.Canvas, color_for: Callable[[int], str], visible_query: Callable[[tuple], Set[int]], sprites: SpriteCache | None = None):
+        self.canvas = canvas
+        self.color_for = color_for
+        self.visible_query = visible_query
+        self.sprites = sprites
+        self.layout: Dict[int, Dict] = {}
+        self.scale = 1.0
+        self.offset_x = 0.0
+        self.offset_y = 0.0
+        self._items: Dict[int, Dict] = {}
+        self._dirty: Set[int] = set()
+        self._visible: Set[int] = set()
+        self._view_dirty = True
+        self._drawn_view: tuple[float, float, float] | None = None
+
+    def set_layout(self, layout: Dict[int, Dict]):
+        self.layout = layout
+        self.reset()
+
+    def reset(self):
+        self._clear_items()
+        self._visible = set()
+        self._dirty = set()
+        self._drawn_view = None
+        self._view_dirty = True
+
+    def invalidate(self, *table_nums: int):
+        self._dirty.update(table_nums)
+
+    def invalidate_all(self):
+        self._dirty.update(self._visible)
+        self._dirty.update(self._items)
+
+    def invalidate_view(self):
+        self._view_dirty = True
+
+    def to_world(self, x: float, y: float) -> tuple[float, float]:
+        return (x + self.offset_x) / self.scale, (y + self.offset_y) / self.scale
+
+    def to_screen(self, x: float, y: float) -> tuple[float, float]:
+        return x * self.scale - self.offset_x, y * self.scale - self.offset_y
+
+    def viewport(self) -> tuple[float, float, float, float]:
+        margin = SEAT_OFFSET + SEAT_RADIUS
+        left, top = self.to_world(0, 0)
+        right, bottom = self.to_world(self.canvas.winfo_width(), self.canvas.winfo_height())
+        return left - margin, top - margin, right + margin, bottom + margin
+
+    def pan(self, dx: float, dy: float):
+        self.offset_x -= dx
+        self.offset_y -= dy
+        self._view_dirty = True
+
+    def zoom_at(self, factor: float, x: float, y: float):
+        scale = round(min(MAX_ZOOM, max(MIN_ZOOM, self.scale * factor)), 3)
+        if scale == self.scale:
+            return
+        wx, wy = self.to_world(x, y)
+        self.scale = scale
+        self.offset_x = wx * scale - x
+        self.offset_y = wy * scale - y
+        self._view_dirty = True
+
+    def detail_level(self) -> int:
+        if self.scale >= SEAT_ZOOM:
+            return 2
+        return 1 if self.scale >= LABEL_ZOOM else 0
+
+    def item_count(self) -> int:
+        return len(self.canvas.find_all())
+
+    def _sync_view(self):
+        self._view_dirty = False
+        view = (self.scale, self.offset_x, self.offset_y)
+        drawn = self._drawn_view
+        if drawn is not None and drawn[0] != self.scale:
+            self._clear_items()
+        elif drawn is not None and (drawn[1], drawn[2]) != (self.offset_x, self.offset_y):
+            self.canvas.move("table", drawn[1] - self.offset_x, drawn[2] - self.offset_y)
+        self._drawn_view = view
+        visible = {table_num for table_num in self.visible_query(self.viewport()) if table_num in self.layout}
+        for table_num in self._visible - visible:
+            if table_num in self._items:
+                self._delete(table_num)
+        self._dirty.update(visible - self._items.keys())
+        self._visible = visible
+
+    def flush(self, deadline: float | None = None) -> bool:
+        if self._view_dirty or any(table_num not in self._visible and table_num in self.layout for table_num in self._dirty):
+            self._sync_view()
+        dirty = sorted(self._dirty)
+        self._dirty = set()
+        for index, table_num in enumerate(dirty):
+            if deadline is not None and index % 16 == 15 and time.perf_counter() > deadline:
+                self._dirty.update(dirty[index:])
+                return False
+            entry = self.layout.get(table_num)
+            state = self._items.get(table_num)
+            if entry is None or table_num not in self._visible:
+                if state is not None:
+                    self._delete(table_num)
+                if entry is None:
+                    self._visible.discard(table_num)
+                continue
+            sides = sides_key(entry["sides"])
+            center = (entry["center"]["x"], entry["center"]["y"])
+            if state is None or state["sides"] != sides:
+                if state is not None:
+                    self._delete(table_num)
+                state = self._create(table_num, entry, sides, center)
+            elif state["center"] != center:
+                self.canvas.move(f"table:{table_num}", (center[0] - state["center"][0]) * self.scale, (center[1] - state["center"][1]) * self.scale)
+                state["center"] = center
+            fill = self.color_for(table_num)
+            if fill != state["fill"]:
+                if state["sprite"] is not None:
+                    key = (sides, fill, self.scale)
+                    self.canvas.itemconfigure(state["rect"], image=self.sprites.acquire(key))
+                    self.sprites.release(state["sprite"])
+                    state["sprite"] = key
+                else:
+                    self.canvas.itemconfigure(state["rect"], fill=fill)
+                state["fill"] = fill
+        return True
+
+    def _create(self, table_num: int, entry: Dict, sides: tuple, center: tuple[int, int]) -> Dict:
+        tags = ("table", f"table:{table_num}")
+        scale = self.scale
+        level = self.detail_level()
+        left, top, right, bottom = table_bounds(entry)
+        left, top = self.to_screen(left, top)
+        right, bottom = self.to_screen(right, bottom)
+        fill = self.color_for(table_num)
+        sprite = None
+        if level >= 2 and self.sprites is not None:
+            sprite = (sides, fill, scale)
+            x, y = self.to_screen(*center)
+            rect = self.canvas.create_image(x, y, image=self.sprites.acquire(sprite), tags=tags)
+        else:
+            rect = self.canvas.create_rectangle(left, top, right, bottom, fill=fill, outline="#0b3d91", width=2 if level else 1, tags=tags)
+        if level >= 1:
+            size = max(6, round(10 * scale))
+            self.canvas.create_text((left + right) / 2, (top + bottom) / 2, text=f"Laud {table_num}", fill="white", font=("Segoe UI", size, "bold"), tags=tags)
+        if level >= 2 and sprite is None:
+            radius = SEAT_RADIUS * scale
+            size = max(6, round(9 * scale))
+            for x, y, n in seat_points(entry):
+                x, y = self.to_screen(x, y)
+                self.canvas.create_oval(x - radius, y - radius, x + radius, y + radius, fill="#ffd166", outline="#8a5b00", tags=tags)
+                self.canvas.create_text(x, y, text=str(n), font=("Segoe UI", size, "bold"), tags=tags)
+        state = {"rect": rect, "sides": sides, "center": center, "fill": fill, "sprite": sprite}
+        self._items[table_num] = state
+        return state
+
+    def _delete(self, table_num: int):
+        self.canvas.delete(f"table:{table_num}")
+        state = self._items.pop(table_num)
+        if state["sprite"] is not None:
+            self.sprites.release(state["sprite"])
+
+    def _clear_items(self):
+        self.canvas.delete("table")
+        if self.sprites is not None:
+            for state in self._items.values():
+                if state["sprite"] is not None:
+                    self.sprites.release(state["sprite"])
+        self._items.clear()
+
+
+class RedrawScheduler:
+    def __init__(self, widget: tk.Misc, budget_ms: float = FRAME_BUDGET_MS):
+        self.widget = widget
+        self.budget = budget_ms / 1000
+        self._handlers: Dict[str, Callable[[float], bool]] = {}
+        self._dirty: Set[str] = set()
+        self._pending: str | None = None
+        self.requests = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.deferred = 0
+
+    def register(self, view: str, handler: Callable[[float], bool]):
+        self._handlers[view] = handler
+
+    def request(self, view: str):
+        self.requests += 1
+        if view in self._dirty:
+            self.coalesced += 1
+            return
+        self._dirty.add(view)
+        if self._pending is None:
+            self._pending = self.widget.after_idle(self._flush)
+
+    def flush_now(self):
+        if self._pending is not None:
+            self.widget.after_cancel(self._pending)
+            self._pending = None
+        self._run(float("inf"))
+
+    def _flush(self):
+        self._pending = None
+        self._run(time.perf_counter() + self.budget)
+
+    def _run(self, deadline: float):
+        self.flushes += 1
+        dirty, self._dirty = self._dirty, set()
+        for view, handler in self._handlers.items():
+            if view in dirty and not handler(deadline):
+                self._dirty.add(view)
+                self.deferred += 1
+        if self._dirty and self._pending is None:
+            self._pending = self.widget.after(1, self._flush)
+
+    def stats(self) -> Dict[str, int]:
+        return {"requests": self.requests, "coalesced": self.coalesced, "flushes": self.flushes, "deferred": self.deferred}
+
+
+class OrderTreeView:
+    def __init__(self, tree: ttk.Treeview):
+        self.tree = tree
+        self.table_number: int | None = None
+        self._rows: Dict[str, tuple] = {}
+        self._lines: Dict[str, Set[str]] = {}
+
+    def sync(self, table: TableData) -> tuple[int, int, int]:
+        if table.table_number != self.table_number:
+            self.tree.delete(*self._lines)
+            self._rows.clear()
+            self._lines.clear()
+            self.table_number = table.table_number
+        inserted = updated = removed = 0
+        guests: Set[str] = set()
+        for guest, items in table.guests.items():
+            guest_iid = f"g:{guest}"
+            guests.add(guest_iid)
+            known = self._lines.get(guest_iid)
+            if known is None:
+                self.tree.insert("", "end", iid=guest_iid, text=guest, open=True, values=(guest, "", "", "", ""))
+                self._rows[guest_iid] = ()
+                known = self._lines[guest_iid] = set()
+                inserted += 1
+            current: Set[str] = set()
+            dirty = False
+            for order in items:
+                iid = f"l:{order.line_id}"
+                current.add(iid)
+                values = (guest, order.name, order.qty, f"{order.unit_price:.2f}", f"{order.total:.2f}")
+                old = self._rows.get(iid)
+                if old is None:
+                    self.tree.insert(guest_iid, "end", iid=iid, values=values)
+                    inserted += 1
+                elif old != values:
+                    self.tree.item(iid, values=values)
+                    updated += 1
+                else:
+                    continue
+                self._rows[iid] = values
+                dirty = True
+            gone = known - current
+            if gone:
+                self.tree.delete(*gone)
+                for iid in gone:
+                    del self._rows[iid]
+                removed += len(gone)
+                dirty = True
+            self._lines[guest_iid] = current
+            if dirty or not self._rows[guest_iid]:
+                values = (guest, "", "", "", f"{table.guest_total(guest):.2f}")
+                if values != self._rows[guest_iid]:
+                    self.tree.item(guest_iid, values=values)
+                    self._rows[guest_iid] = values
+                    updated += 1
+        for guest_iid in self._lines.keys() - guests:
+            self.tree.delete(guest_iid)
+            for iid in self._lines.pop(guest_iid):
+                del self._rows[iid]
+            del self._rows[guest_iid]
+            removed += 1
+        return inserted, updated, removed
 
 
 class RestaurantServiceApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, core: RestaurantCore | CoreClient | None = None):
         super().__init__()
         self.title(APP_TITLE)
         self.geometry("1100x720")
 
         self.layout_file = Path(DEFAULT_LAYOUT_FILE)
-        self.codes_file = Path(CODES_FILE)
 
-        self.codes: List[str] = []
+        self.principal: Principal | None = None
         self.current_code: str | None = None
         self.table_layout: Dict[int, Dict] = {}
-        self.table_data: Dict[int, TableData] = {}
         self.selected_table: int | None = None
+        self.selected_tables: Set[int] = set()
+        self.search_matches: Dict[int, Set[int]] = {}
+        self._search_pending = False
         self.pending_table: Dict | None = None
         self.order_window: tk.Toplevel | None = None
+        self.order_window_table: int | None = None
+        self.table_index = SpatialGrid()
+        self.seat_index = SpatialGrid()
+        self._seat_counts: Dict[int, int] = {}
+        self.current_floor = DEFAULT_FLOOR
+        self._floor_tables: Dict[str, List[int]] = {}
+        self._floor_indexes: Dict[str, tuple[SpatialGrid, SpatialGrid, Dict[int, int]]] = {}
+        self._compiled: CompiledLayout | None = None
+        self._pan_anchor: tuple[int, int] | None = None
+        self.persistence = PersistenceWorker()
+        self.credentials = self._open_credentials()
+        self.catalog = MenuCatalog(Path(MENU_FILE))
+        self.output = self._open_output()
 
-        self._load_codes()
         self._build_ui()
+        self.scheduler = RedrawScheduler(self)
+        self.scheduler.register("map", self._flush_map)
+        self.scheduler.register("order", self._flush_order)
+        METRICS.add_source("scheduler", self.scheduler.stats)
+        METRICS.add_source("sprites", self._sprite_stats)
+        METRICS.add_source("autosave", self.persistence.stats)
+        METRICS.add_source("menu", self.catalog.stats)
+        METRICS.add_source("auth", self.credentials.stats)
+        METRICS.add_source("output", self.output.stats)
+        METRICS.add_source("sales", lambda: self.core.sales.stats() if isinstance(self.core, RestaurantCore) else {})
+        self._reload_catalog()
+        self.core = core if core is not None else self._open_core()
+        self.core.subscribe(self._on_core_event)
         self.load_layout(self.layout_file)
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.after(int(JOURNAL_SYNC_SECONDS * 1000), self._core_maintenance)
         self.after(50, self.require_authentication)
 
     def _build_ui(self):
@@ -92,46 +982,196 @@ class RestaurantServiceApp(tk.Tk):
         self.manage_codes_btn = ttk.Button(top, text="Lisa pääsukood", command=self.add_code_dialog)
         self.manage_codes_btn.pack(side="left", padx=4)
 
+        self.import_btn = ttk.Button(top, text="Impordi lauad", command=self.import_tables_dialog)
+        self.import_btn.pack(side="left", padx=4)
+
+        self.edit_selection_btn = ttk.Button(top, text="Muuda valikut", command=self.edit_selection_dialog)
+        self.edit_selection_btn.pack(side="left", padx=4)
+
+        self.diagnostics_btn = ttk.Button(top, text="Diagnostika", command=self.open_diagnostics_window)
+        self.diagnostics_btn.pack(side="left", padx=4)
+
+        self.report_btn = ttk.Button(top, text="Aruanne", command=self.open_report_window)
+        self.report_btn.pack(side="left", padx=4)
+
         ttk.Button(top, text="Ava tellimuse aken", command=self.open_order_window).pack(side="left", padx=4)
         ttk.Button(top, text="Salvesta kaart", command=self.save_layout_dialog).pack(side="left", padx=4)
         ttk.Button(top, text="Laadi kaart", command=self.load_layout_dialog).pack(side="left", padx=4)
         ttk.Button(top, text="Logi välja", command=self.logout).pack(side="right", padx=4)
 
+        self.floor_var = tk.StringVar(value=DEFAULT_FLOOR)
+        self.floor_box = ttk.Combobox(top, textvariable=self.floor_var, values=[DEFAULT_FLOOR], width=8)
+        self.floor_box.pack(side="right", padx=4)
+        self.floor_box.bind("<<ComboboxSelected>>", lambda _e: self._use_floor(self.floor_var.get().strip()))
+        self.floor_box.bind("<Return>", lambda _e: self._use_floor(self.floor_var.get().strip()))
+        ttk.Label(top, text="Korrus:").pack(side="right")
+
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(top, textvariable=self.search_var, width=18)
+        search_entry.pack(side="right", padx=(4, 12))
+        search_entry.bind("<Escape>", lambda _e: self.search_var.set(""))
+        ttk.Label(top, text="Otsi:").pack(side="right")
+        self.search_var.trace_add("write", lambda *_: self._schedule_search())
+
         self.map_canvas = tk.Canvas(self, bg="#f6f8fa")
         self.map_canvas.pack(fill="both", expand=True, padx=8, pady=(0, 8))
         self.map_canvas.bind("<Button-1>", self._on_canvas_click)
-
-        self.map_hint_label = ttk.Label(self, text="")
-        self.map_hint_label.pack(anchor="w", padx=10, pady=(0, 8))
-
-    def _load_codes(self):
-        if self.codes_file.exists():
-            try:
-                raw = json.loads(self.codes_file.read_text(encoding="utf-8"))
-                loaded = raw.get("codes", [])
-                self.codes = sorted(set([code for code in loaded if isinstance(code, str)] + [SUPER_CODE]))
-                return
-            except Exception:
-                pass
-        self.codes = [SUPER_CODE]
-        self._save_codes()
-
-    def _save_codes(self):
-        self.codes_file.write_text(json.dumps({"codes": sorted(set(self.codes))}, indent=2), encoding="utf-8")
-
-    def _is_super(self) -> bool:
-        return self.current_code == SUPER_CODE
+        self.map_canvas.bind("<Shift-Button-1>", self._on_canvas_shift_click)
+        for key, dx, dy in (("Left", -1, 0), ("Right", 1, 0), ("Up", 0, -1), ("Down", 0, 1)):
+            self.map_canvas.bind(f"<{key}>", lambda _e, dx=dx, dy=dy: self.selected_tables and self.move_selection(dx * MOVE_STEP, dy * MOVE_STEP))
+        self.map_canvas.bind("<Delete>", lambda _e: self.selected_tables and self.delete_selection())
+        self.map_canvas.bind("<Escape>", lambda _e: self._set_selection(set()))
+        self.map_canvas.bind("<Control-a>", lambda _e: self._set_selection(set(self._floor_tables.get(self.current_floor, []))))
+        for button in ("2", "3"):
+            self.map_canvas.bind(f"<ButtonPress-{button}>", self._on_pan_start)
+            self.map_canvas.bind(f"<B{button}-Motion>", self._on_pan_move)
+        self.map_canvas.bind("<MouseWheel>", lambda e: self._on_zoom(e, 1 if e.delta > 0 else -1))
+        self.map_canvas.bind("<Button-4>", lambda e: self._on_zoom(e, 1))
+        self.map_canvas.bind("<Button-5>", lambda e: self._on_zoom(e, -1))
+        self.map_canvas.bind("<Configure>", self._on_canvas_resize)
+        sprites = SpriteCache(lambda width, height: tk.PhotoImage(master=self.map_canvas, width=width, height=height))
+        self.map_renderer = MapRenderer(self.map_canvas, self._table_color, lambda rect: self.table_index.query_rect(rect), sprites)
+
+        status = ttk.Frame(self)
+        status.pack(fill="x", padx=10, pady=(0, 8))
+        self.map_hint_label = ttk.Label(status, text="")
+        self.map_hint_label.pack(side="left")
+        self.output_label = ttk.Label(status, text="")
+        self.output_label.pack(side="right")
+
+    def _open_core(self) -> RestaurantCore:
+        try:
+            return open_local_core()
+        except (OSError, ValueError) as exc:
+            messagebox.showwarning(APP_TITLE, f"Tellimuste logi taastamine ebaõnnestus: {exc}", parent=self)
+            return RestaurantCore()
+
+    def _on_core_event(self, event: Dict):
+        if self.search_var.get().strip():
+            self._schedule_search()
+        if event["type"] == "reset":
+            self.map_renderer.invalidate_all()
+            self.request_redraw()
+            self.request_order_refresh()
+            return
+        table_num = event["table"]
+        if event["type"] in ("owner", "state"):
+            self.invalidate_table(table_num)
+            self.request_redraw()
+            if event["type"] == "owner":
+                self._update_user_label()
+        elif table_num == self.selected_table:
+            self.request_order_refresh()
+
+    def _core_call(self, func: Callable, *args, parent: tk.Misc | None = None, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except AccessDenied:
+            messagebox.showwarning(APP_TITLE, "See laud on teise teenindaja kasutuses.", parent=parent or self)
+        except VersionConflict:
+            messagebox.showwarning(APP_TITLE, "Laua andmed muutusid teises terminalis. Proovi uuesti.", parent=parent or self)
+        except CoreError as exc:
+            messagebox.showerror(APP_TITLE, str(exc), parent=parent or self)
+        self.request_redraw()
+        return None
+
+    def _core_maintenance(self):
+        try:
+            self.core.maintenance()
+        except CoreError as exc:
+            self.map_hint_label.config(text=str(exc))
+        for exc in self.core.take_failures():
+            self.map_hint_label.config(text=f"Logi kokkupakkimine ebaõnnestus: {exc}")
+        for path, exc in self.persistence.take_failures():
+            self.map_hint_label.config(text=f"Faili {path} salvestamine ebaõnnestus: {exc}")
+        for path, exc in self.persistence.take_completed():
+            if exc is None:
+                self.map_hint_label.config(text="")
+                messagebox.showinfo(APP_TITLE, f"Kaart salvestatud ({path.name}).", parent=self)
+            else:
+                messagebox.showerror(APP_TITLE, f"Kaardi salvestamine ebaõnnestus: {exc}", parent=self)
+        for route, doc, exc in self.output.take_failures():
+            self.map_hint_label.config(text=f"Väljund {route}: {doc.kind} {doc.seq} jäi trükkimata ({exc})")
+        self._update_output_label()
+        self._reload_catalog()
+        self.after(int(JOURNAL_SYNC_SECONDS * 1000), self._core_maintenance)
+
+    def _open_credentials(self) -> CredentialStore:
+        try:
+            return CredentialStore(Path(CODES_FILE), writer=self.persistence.append).open()
+        except (OSError, ValueError) as exc:
+            messagebox.showerror(APP_TITLE, f"Pääsukoodide laadimine ebaõnnestus: {exc}", parent=self)
+            self.persistence.close()
+            self.destroy()
+            raise SystemExit(1)
+
+    def _open_output(self) -> OutputPipeline:
+        try:
+            return OutputPipeline(load_output_routes(Path(OUTPUT_CONFIG_FILE)))
+        except (OSError, ValueError) as exc:
+            message = f"Väljundi seadistus on vigane: {exc}"
+            self.after(50, lambda: self.map_hint_label.config(text=message))
+            return OutputPipeline({DEFAULT_ROUTE: SpoolSink(Path(OUTPUT_SPOOL_DIR))})
+
+    def _update_output_label(self):
+        stats = self.output.stats()
+        queued = stats["batched"] + sum(sink["queued"] for sink in stats["sinks"].values())
+        slowest = max((sink["p95_ms"] for sink in stats["sinks"].values()), default=0.0)
+        failed = sum(sink["failed"] for sink in stats["sinks"].values())
+        text = f"Väljund: {queued} ootel · p95 {slowest:.0f} ms"
+        if failed:
+            text += f" · {failed} ebaõnnestus"
+        self.output_label.config(text=text)
+
+    def _queue_ticket(self, table_num: int, item: OrderItem):
+        menu_item = self.catalog.get(item.item_id) if item.item_id else None
+        station = (menu_item.station or menu_item.category) if menu_item is not None else ""
+        if not self.output.order(table_num, item.guest_id, item.name, item.qty, station or DEFAULT_STATION):
+            self.map_hint_label.config(text="Köögi väljundi järjekord on täis – tellimust ei saadetud köögile.")
+
+    def _queue_receipt(self, text: str):
+        if not self.output.receipt(text):
+            self.map_hint_label.config(text="Tšekiprinteri järjekord on täis – tšekk jäi trükkimata.")
+
+    def _reload_catalog(self):
+        try:
+            self.catalog.reload_if_changed()
+        except (OSError, ValueError) as exc:
+            self.map_hint_label.config(text=f"Menüü laadimine ebaõnnestus: {exc}")
+
+    def _on_close(self):
+        self._close_order_window()
+        if self.current_code:
+            self._release_claims(self.core.tables_of(self.current_code))
+        self.output.close()
+        self.persistence.close()
+        self.core.close()
+        self.destroy()
+
+    def _all_tables(self) -> bool:
+        return self._can(PERM_ALL_TABLES)
+
+    def _can(self, permission: str) -> bool:
+        return self.principal is not None and self.principal.can(permission)
 
     def _update_role_controls(self):
-        if self._is_super():
-            self.add_table_btn.state(["!disabled"])
-            self.manage_codes_btn.state(["!disabled"])
-        else:
-            self.add_table_btn.state(["disabled"])
-            self.manage_codes_btn.state(["disabled"])
-        who = self.current_code if self.current_code else "-"
-        suffix = " (SUPER)" if self._is_super() else ""
-        self.user_label.config(text=f"Kasutaja: {who}{suffix}")
+        for button, permission in (
+            (self.add_table_btn, PERM_LAYOUT),
+            (self.manage_codes_btn, PERM_CODES),
+            (self.import_btn, PERM_LAYOUT),
+            (self.edit_selection_btn, PERM_LAYOUT),
+            (self.diagnostics_btn, PERM_DIAGNOSTICS),
+            (self.report_btn, PERM_REPORTS),
+        ):
+            button.state(["!disabled"] if self._can(permission) else ["disabled"])
+        self._update_user_label()
+
+    def _update_user_label(self):
+        who = self.principal.user_id if self.principal else "-"
+        suffix = f" ({self.principal.role})" if self.principal else ""
+        mine = sorted(self.core.tables_of(self.current_code)) if self.current_code else []
+        tables = f" · minu lauad: {', '.join(map(str, mine))}" if mine else ""
+        self.user_label.config(text=f"Kasutaja: {who}{suffix}{tables}")
 
     def _front_dialog(self, dialog: tk.Toplevel, parent: tk.Misc | None = None):
         owner = parent if parent is not None else self
@@ -144,51 +1184,85 @@ class RestaurantServiceApp(tk.Tk):
         while True:
             code = simpledialog.askstring("Autentimine", "Sisesta pääsukood:", parent=self)
             if code is None:
-                self.destroy()
+                self._on_close()
                 return
-            code = code.strip()
-            if code in self.codes:
-                self.current_code = code
+            try:
+                principal = self.credentials.verify(code)
+            except LoginThrottled as exc:
+                messagebox.showerror(APP_TITLE, str(exc), parent=self)
+                continue
+            if principal is not None:
+                self.principal = principal
+                self.current_code = principal.user_id
                 self._update_role_controls()
-                self.redraw_map()
+                self.map_renderer.invalidate_all()
+                self.request_redraw()
                 return
             messagebox.showerror(APP_TITLE, "Vale kood.", parent=self)
 
     def logout(self):
+        self._close_order_window()
+        if self.current_code:
+            self._release_claims(self.core.tables_of(self.current_code))
+        self.principal = None
         self.current_code = None
-        self.selected_table = None
-        if self.order_window and self.order_window.winfo_exists():
-            self.order_window.destroy()
+        self._select_table(None)
+        self._set_selection(set())
+        self.map_renderer.invalidate_all()
         self._update_role_controls()
         self.require_authentication()
 
     def add_code_dialog(self):
-        if not self._is_super():
-            messagebox.showwarning(APP_TITLE, "Ainult SUPER saab koode lisada.", parent=self)
-            return
-        code = simpledialog.askstring("Uus kood", "Sisesta uus 4-kohaline kood:", parent=self)
-        if not code:
+        if not self._can(PERM_CODES):
+            messagebox.showwarning(APP_TITLE, "Koodide lisamise õigus puudub.", parent=self)
             return
-        code = code.strip()
-        if len(code) != 4 or not code.isdigit():
-            messagebox.showerror(APP_TITLE, "Kood peab olema 4-kohaline number.", parent=self)
-            return
-        self.codes.append(code)
-        self._save_codes()
-        messagebox.showinfo(APP_TITLE, f"Kood {code} lisatud.", parent=self)
+        dlg = tk.Toplevel(self)
+        dlg.title("Uus pääsukood")
+        self._front_dialog(dlg)
+        form = ttk.Frame(dlg, padding=10)
+        form.pack(fill="both", expand=True)
+        user_var = tk.StringVar()
+        code_var = tk.StringVar()
+        role_var = tk.StringVar(value="teenindaja")
+        ttk.Label(form, text="Nimi:").grid(row=0, column=0, sticky="w", pady=2)
+        user_entry = ttk.Entry(form, textvariable=user_var, width=24)
+        user_entry.grid(row=0, column=1, sticky="ew", pady=2)
+        ttk.Label(form, text="Kood (4–8 numbrit):").grid(row=1, column=0, sticky="w", pady=2)
+        ttk.Entry(form, textvariable=code_var, width=24, show="•").grid(row=1, column=1, sticky="ew", pady=2)
+        ttk.Label(form, text="Roll:").grid(row=2, column=0, sticky="w", pady=2)
+        ttk.Combobox(form, textvariable=role_var, values=list(ROLE_PERMISSIONS), state="readonly", width=22).grid(row=2, column=1, sticky="ew", pady=2)
+        user_entry.focus_set()
+
+        def save():
+            replace = user_var.get().strip() in self.credentials
+            if replace and not messagebox.askyesno(APP_TITLE, f"Kasutaja {user_var.get().strip()} on juba olemas. Kas asendada tema kood ja roll?", parent=dlg):
+                return
+            try:
+                principal = self.credentials.add(code_var.get(), user_var.get(), role_var.get(), replace=replace)
+            except (ValueError, OSError) as exc:
+                messagebox.showerror(APP_TITLE, str(exc), parent=dlg)
+                return
+            dlg.destroy()
+            messagebox.showinfo(APP_TITLE, f"Kood lisatud: {principal.user_id} ({principal.role}).", parent=self)
+
+        buttons = ttk.Frame(form)
+        buttons.grid(row=3, column=0, columnspan=2, sticky="e", pady=(8, 0))
+        ttk.Button(buttons, text="Salvesta", command=save).pack(side="right")
+        ttk.Button(buttons, text="Tühista", command=dlg.destroy).pack(side="right", padx=4)
+        dlg.bind("<Return>", lambda _e: save())
 
     def add_table_dialog(self):
-        if not self._is_super():
-            messagebox.showwarning(APP_TITLE, "Laua lisamine on ainult SUPER kasutajale.", parent=self)
+        if not self._can(PERM_LAYOUT):
+            messagebox.showwarning(APP_TITLE, "Laua lisamise õigus puudub.", parent=self)
             return
 
         number = simpledialog.askinteger("Laua number", "Sisesta laua number:", minvalue=1, parent=self)
         if not number:
             return
-        up = simpledialog.askinteger("Ülemine külg", "Mitu inimest istub üleval küljel?", minvalue=0, parent=self)
-        right = simpledialog.askinteger("Parem külg", "Mitu inimest istub paremal küljel?", minvalue=0, parent=self)
-        down = simpledialog.askinteger("Alumine külg", "Mitu inimest istub all küljel?", minvalue=0, parent=self)
-        left = simpledialog.askinteger("Vasak külg", "Mitu inimest istub vasakul küljel?", minvalue=0, parent=self)
+        up = simpledialog.askinteger("Ülemine külg", "Mitu inimest istub üleval küljel?", minvalue=0, maxvalue=MAX_SIDE_SEATS, parent=self)
+        right = simpledialog.askinteger("Parem külg", "Mitu inimest istub paremal küljel?", minvalue=0, maxvalue=MAX_SIDE_SEATS, parent=self)
+        down = simpledialog.askinteger("Alumine külg", "Mitu inimest istub all küljel?", minvalue=0, maxvalue=MAX_SIDE_SEATS, parent=self)
+        left = simpledialog.askinteger("Vasak külg", "Mitu inimest istub vasakul küljel?", minvalue=0, maxvalue=MAX_SIDE_SEATS, parent=self)
         if None in (up, right, down, left):
             return
         if up + right + down + left == 0:
@@ -196,104 +1270,396 @@ class RestaurantServiceApp(tk.Tk):
             return
 
         self.pending_table = {"number": number, "sides": {"up": up, "right": right, "down": down, "left": left}}
-        self.table_data.setdefault(number, TableData(number))
         self.map_hint_label.config(text=f"Klõpsa kaardil laua {number} keskpunkti asukohta.")
 
-    def _table_size(self, sides: Dict[str, int]) -> tuple[int, int]:
-        width = max(MIN_TABLE_SIDE, max(1, max(sides["up"], sides["down"])) * BASE_UNIT)
-        height = max(MIN_TABLE_SIDE, max(1, max(sides["left"], sides["right"])) * BASE_UNIT)
-        return width, height
-
-    def _table_bounds(self, entry: Dict) -> tuple[int, int, int, int]:
-        cx, cy = entry["center"]["x"], entry["center"]["y"]
-        w, h = self._table_size(entry["sides"])
-        return cx - w // 2, cy - h // 2, cx + w // 2, cy + h // 2
-
-    def _seat_points(self, entry: Dict) -> List[tuple[float, float, int]]:
-        left, top, right, bottom = self._table_bounds(entry)
-        sides = entry["sides"]
-        points: List[tuple[float, float, int]] = []
-        seat_number = 1
-
-        def spread(start: float, end: float, count: int):
-            if count <= 0:
-                return []
-            step = (end - start) / (count + 1)
-            return [start + step * (i + 1) for i in range(count)]
-
-        for x in spread(left, right, sides["up"]):
-            points.append((x, top - SEAT_OFFSET, seat_number)); seat_number += 1
-        for y in spread(top, bottom, sides["right"]):
-            points.append((right + SEAT_OFFSET, y, seat_number)); seat_number += 1
-        for x in reversed(spread(left, right, sides["down"])):
-            points.append((x, bottom + SEAT_OFFSET, seat_number)); seat_number += 1
-        for y in reversed(spread(top, bottom, sides["left"])):
-            points.append((left - SEAT_OFFSET, y, seat_number)); seat_number += 1
-        return points
-
     def _table_owner(self, table_num: int) -> str | None:
-        return self.table_layout.get(table_num, {}).get("owner")
+        return self.core.owner(table_num)
+
+    def _select_table(self, table_num: int | None):
+        if table_num != self.selected_table:
+            if self.selected_table is not None:
+                self.invalidate_table(self.selected_table)
+            if table_num is not None:
+                self.invalidate_table(table_num)
+        self.selected_table = table_num
+
+    def invalidate_table(self, table_num: int):
+        self.map_renderer.invalidate(table_num)
+
+    def _index_table(self, table_num: int):
+        self._unindex_table(table_num)
+        entry = self.table_layout.get(table_num)
+        if entry is None:
+            return
+        self.table_index.insert(table_num, table_bounds(entry))
+        points = seat_points(entry)
+        for x, y, n in points:
+            self.seat_index.insert((table_num, n), (x - SEAT_RADIUS, y - SEAT_RADIUS, x + SEAT_RADIUS, y + SEAT_RADIUS))
+        self._seat_counts[table_num] = len(points)
+
+    def _unindex_table(self, table_num: int):
+        self.table_index.remove(table_num)
+        for n in range(1, self._seat_counts.pop(table_num, 0) + 1):
+            self.seat_index.remove((table_num, n))
+
+    def _rebuild_index(self):
+        self._floor_indexes = {}
+        if self._compiled is not None:
+            self._floor_tables = self._compiled.floor_tables()
+        else:
+            self._floor_tables = {}
+            for table_num, entry in self.table_layout.items():
+                self._floor_tables.setdefault(table_floor(entry), []).append(table_num)
+        floors = sorted(self._floor_tables) or [DEFAULT_FLOOR]
+        self.floor_box.config(values=floors)
+        self._use_floor(self.current_floor if self.current_floor in self._floor_tables else floors[0])
+
+    def _use_floor(self, floor: str):
+        if not floor:
+            return
+        cached = self._floor_indexes.get(floor)
+        if cached is None and self._compiled is not None:
+            cached = self._floor_indexes[floor] = self._compiled.floor_index(floor)
+        elif cached is None:
+            cached = self._floor_indexes[floor] = (SpatialGrid(), SpatialGrid(), {})
+            self.table_index, self.seat_index, self._seat_counts = cached
+            for table_num in self._floor_tables.get(floor, []):
+                self._index_table(table_num)
+        self.table_index, self.seat_index, self._seat_counts = cached
+        if floor != self.current_floor and self.selected_table is not None:
+            self._select_table(None)
+        if floor != self.current_floor:
+            self.selected_tables.clear()
+        self.current_floor = floor
+        self.floor_var.set(floor)
+        self.map_renderer.reset()
+        self.request_redraw()
+
+    def _on_pan_start(self, event):
+        self._pan_anchor = (event.x, event.y)
+
+    def _on_pan_move(self, event):
+        if self._pan_anchor is None:
+            return
+        self.map_renderer.pan(event.x - self._pan_anchor[0], event.y - self._pan_anchor[1])
+        self._pan_anchor = (event.x, event.y)
+        self.request_redraw()
+
+    def _on_zoom(self, event, direction: int):
+        self.map_renderer.zoom_at(1.2 if direction > 0 else 1 / 1.2, event.x, event.y)
+        self.request_redraw()
+
+    def _on_canvas_resize(self, _event):
+        self.map_renderer.invalidate_view()
+        self.request_redraw()
+
+    def _hit_test(self, x: float, y: float) -> tuple[int, int | None] | None:
+        tables = self.table_index.query_point(x, y)
+        if tables:
+            return max(tables), None
+        seats = self.seat_index.query_point(x, y)
+        if seats:
+            return max(seats)
+        return None
+
+    def _overlapping_tables(self, entry: Dict, ignore: int | None = None) -> Set[int]:
+        area = table_footprint(entry)
+        hits = set(self.table_index.query_rect(area))
+        hits.update(table_num for table_num, _ in self.seat_index.query_rect(area))
+        hits.discard(ignore)
+        return hits
 
     def _table_is_free(self, table_num: int) -> bool:
-        owner = self._table_owner(table_num)
-        table = self.table_data.setdefault(table_num, TableData(table_num))
-        if owner is None:
-            return True
-        if not table.has_unpaid():
-            self.table_layout[table_num]["owner"] = None
-            return True
-        return False
+        return self.core.is_free(table_num)
 
     def _table_accessible(self, table_num: int) -> bool:
-        if self._is_super():
-            return True
-        owner = self._table_owner(table_num)
-        return owner in (None, self.current_code)
+        return self.core.accessible(table_num, self.current_code, self._all_tables())
 
     def _table_color(self, table_num: int) -> str:
+        if table_num in self.selected_tables:
+            return "#8250df"  # batch selection
+        if table_num in self.search_matches:
+            return "#d29922"  # search match
         if self._table_is_free(table_num):
             return "#2ea043"  # green
         owner = self._table_owner(table_num)
-        if self._is_super() or owner == self.current_code:
+        if self._all_tables() or owner == self.current_code:
             return "#1f6feb" if self.selected_table != table_num else "#0b3d91"
         return "#d73a49"  # occupied by another waiter
 
-    def redraw_map(self):
-        self.map_canvas.delete("all")
-        for table_num, entry in sorted(self.table_layout.items()):
-            left, top, right, bottom = self._table_bounds(entry)
-            fill = self._table_color(table_num)
-            self.map_canvas.create_rectangle(left, top, right, bottom, fill=fill, outline="#0b3d91", width=2)
-            self.map_canvas.create_text((left + right) // 2, (top + bottom) // 2, text=f"Laud {table_num}", fill="white", font=("Segoe UI", 10, "bold"))
-            for x, y, n in self._seat_points(entry):
-                self.map_canvas.create_oval(x - SEAT_RADIUS, y - SEAT_RADIUS, x + SEAT_RADIUS, y + SEAT_RADIUS, fill="#ffd166", outline="#8a5b00")
-                self.map_canvas.create_text(x, y, text=str(n), font=("Segoe UI", 9, "bold"))
+    def request_redraw(self):
+        self.scheduler.request("map")
+
+    def request_order_refresh(self):
+        self.scheduler.request("order")
+
+    @METRICS.timed("redraw_map")
+    def _flush_map(self, deadline: float) -> bool:
+        done = self.map_renderer.flush(deadline)
+        if METRICS.enabled:
+            METRICS.gauge("canvas_items", self.map_renderer.item_count())
+        return done
+
+    def _sprite_stats(self) -> Dict[str, int]:
+        sprites = self.map_renderer.sprites
+        if sprites is None:
+            return {}
+        return {"cached": len(sprites), "hits": sprites.hits, "misses": sprites.misses}
+
+    def _flush_order(self, deadline: float) -> bool:
+        if self.order_window and self.order_window.winfo_exists():
+            self._refresh_order_widgets(self._order_tree, self._order_total_label)
+        return True
 
+    @METRICS.timed("canvas_click")
     def _on_canvas_click(self, event):
+        self.map_canvas.focus_set()
+        x, y = self.map_renderer.to_world(event.x, event.y)
         if self.pending_table is not None:
             n = self.pending_table["number"]
-            self.table_layout[n] = {"center": {"x": event.x, "y": event.y}, "sides": self.pending_table["sides"], "owner": None}
+            entry = {"center": {"x": round(x), "y": round(y)}, "sides": self.pending_table["sides"], "floor": self.current_floor}
+            if self._overlapping_tables(entry, ignore=n):
+                messagebox.showwarning(APP_TITLE, "Laud kattuks teise lauaga. Vali uus asukoht.", parent=self)
+                return
+            previous = self.table_layout.get(n)
+            if previous is not None and table_floor(previous) != self.current_floor:
+                self._floor_tables[table_floor(previous)].remove(n)
+                self._floor_indexes.pop(table_floor(previous), None)
+            if previous is None or table_floor(previous) != self.current_floor:
+                self._floor_tables.setdefault(self.current_floor, []).append(n)
+                self.floor_box.config(values=sorted(self._floor_tables))
+            self.table_layout[n] = entry
+            self._compiled = None
             self.pending_table = None
-            self.selected_table = n
+            self._index_table(n)
+            self.invalidate_table(n)
+            self._select_table(n)
             self.map_hint_label.config(text="")
-            self.redraw_map()
+            self.save_layout()
+            self.request_redraw()
             return
 
-        for table_num, entry in self.table_layout.items():
-            left, top, right, bottom = self._table_bounds(entry)
-            if left <= event.x <= right and top <= event.y <= bottom:
-                if not self._table_accessible(table_num):
-                    messagebox.showwarning(APP_TITLE, "See laud on teise teenindaja kasutuses.", parent=self)
-                    return
-                self.selected_table = table_num
-                self.redraw_map()
+        hit = self._hit_test(x, y)
+        if hit is None:
+            return
+        table_num, _seat = hit
+        if not self._table_accessible(table_num):
+            messagebox.showwarning(APP_TITLE, "See laud on teise teenindaja kasutuses.", parent=self)
+            return
+        self._select_table(table_num)
+        self.request_redraw()
+
+    def _on_canvas_shift_click(self, event):
+        self.map_canvas.focus_set()
+        if not self._can(PERM_LAYOUT):
+            return
+        hit = self._hit_test(*self.map_renderer.to_world(event.x, event.y))
+        if hit is not None:
+            self._set_selection(self.selected_tables ^ {hit[0]})
+
+    def _set_selection(self, tables: Set[int]):
+        changed = self.selected_tables ^ tables
+        self.selected_tables = set(tables)
+        if changed:
+            self.map_renderer.invalidate(*changed)
+            self.request_redraw()
+        self.map_hint_label.config(text=f"Valitud {len(tables)} lauda." if tables else "")
+
+    def _schedule_search(self):
+        if not self._search_pending:
+            self._search_pending = True
+            self.after_idle(self._run_search)
+
+    @METRICS.timed("table_search")
+    def _run_search(self):
+        self._search_pending = False
+        query = self.search_var.get().strip()
+        matches = self.core.search(query) if query else {}
+        changed = matches.keys() ^ self.search_matches.keys()
+        self.search_matches = matches
+        if changed:
+            self.map_renderer.invalidate(*changed)
+            self.request_redraw()
+        if not query:
+            self.map_hint_label.config(text="")
+            return
+        floors: Dict[str, List[int]] = {}
+        for table_num in sorted(matches):
+            entry = self.table_layout.get(table_num)
+            if entry is not None:
+                floors.setdefault(table_floor(entry), []).append(table_num)
+        if not floors:
+            self.map_hint_label.config(text=f"Otsing „{query}“: avatud laudu ei leitud.")
+            return
+        lines = sum(len(matches[table_num]) for tables in floors.values() for table_num in tables)
+        where = "; ".join(f"korrus {floor}: {', '.join(map(str, tables))}" for floor, tables in sorted(floors.items()))
+        self.map_hint_label.config(text=f"Otsing „{query}“: {sum(map(len, floors.values()))} lauda, {lines} rida – {where}")
+
+    def _selection_entries(self) -> Dict[int, Dict] | None:
+        tables = {n: self.table_layout[n] for n in sorted(self.selected_tables) if n in self.table_layout}
+        if not self._can(PERM_LAYOUT):
+            messagebox.showwarning(APP_TITLE, "Laudade muutmise õigus puudub.", parent=self)
+            return None
+        if not tables:
+            messagebox.showwarning(APP_TITLE, "Vali lauad kaardilt Shift+klõpsuga.", parent=self)
+            return None
+        return tables
+
+    def _apply_layout_changes(self, changes: Dict[int, Dict | None]) -> bool:
+        conflicts = []
+        batch = SpatialGrid()
+        for n, entry in sorted(changes.items()):
+            if entry is None:
+                continue
+            area = table_footprint(entry)
+            hits = (self._overlapping_tables(entry) - changes.keys()) | batch.query_rect(area)
+            conflicts.extend(f"Laud {n} kattuks lauaga {other}." for other in sorted(hits))
+            batch.insert(n, area)
+        if conflicts:
+            messagebox.showwarning(APP_TITLE, "\n".join(conflicts[:10]), parent=self)
+            return False
+        for n, entry in changes.items():
+            self._unindex_table(n)
+            if entry is None:
+                previous = self.table_layout.pop(n)
+                self._floor_tables[table_floor(previous)].remove(n)
+                self.selected_tables.discard(n)
+                if self.selected_table == n:
+                    self.selected_table = None
+            else:
+                self.table_layout[n] = entry
+                self._index_table(n)
+        self._compiled = None
+        self.map_renderer.invalidate(*changes)
+        self.save_layout()
+        self.request_redraw()
+        return True
+
+    def move_selection(self, dx: int, dy: int):
+        tables = self._selection_entries()
+        if tables:
+            self._apply_layout_changes({n: dict(entry, center={"x": entry["center"]["x"] + dx, "y": entry["center"]["y"] + dy}) for n, entry in tables.items()})
+
+    def resize_selection(self, sides: Dict[str, int]):
+        tables = self._selection_entries()
+        if tables:
+            self._apply_layout_changes({n: dict(entry, sides=dict(sides)) for n, entry in tables.items()})
+
+    def delete_selection(self):
+        tables = self._selection_entries()
+        if not tables:
+            return
+        busy = [n for n in tables if not self._table_is_free(n)]
+        if busy:
+            unpaid = [n for n in busy if self.core.table(n).has_unpaid()]
+            claimed = [n for n in busy if n not in unpaid]
+            reasons = []
+            if unpaid:
+                reasons.append(f"laudadel {', '.join(map(str, unpaid))} on maksmata tellimusi")
+            if claimed:
+                reasons.append(f"lauad {', '.join(map(str, claimed))} on teenindaja kasutuses")
+            messagebox.showwarning(APP_TITLE, f"Kustutada ei saa: {'; '.join(reasons)}.", parent=self)
+            return
+        if messagebox.askyesno(APP_TITLE, f"Kustutada {len(tables)} lauda?", parent=self):
+            self._apply_layout_changes(dict.fromkeys(tables))
+            self._set_selection(set())
+
+    def edit_selection_dialog(self):
+        if self._selection_entries() is None:
+            return
+        dlg = tk.Toplevel(self)
+        dlg.title("Valitud lauad")
+        self._front_dialog(dlg)
+        ttk.Label(dlg, text=f"Valitud lauad: {', '.join(map(str, sorted(self.selected_tables)))}", wraplength=320).grid(row=0, column=0, columnspan=4, padx=12, pady=(12, 6), sticky="w")
+        dx_var, dy_var = tk.StringVar(value="0"), tk.StringVar(value="0")
+        ttk.Label(dlg, text="Nihe x, y:").grid(row=1, column=0, padx=12, sticky="w")
+        ttk.Entry(dlg, textvariable=dx_var, width=6).grid(row=1, column=1)
+        ttk.Entry(dlg, textvariable=dy_var, width=6).grid(row=1, column=2)
+        sides_var = tk.StringVar(value=",".join(str(v) for v in sides_key(self.table_layout[min(self.selected_tables & self.table_layout.keys())]["sides"])))
+        ttk.Label(dlg, text="Kohad (üleval, paremal, all, vasakul):").grid(row=2, column=0, padx=12, sticky="w")
+        ttk.Entry(dlg, textvariable=sides_var, width=14).grid(row=2, column=1, columnspan=2)
+
+        def move():
+            try:
+                self.move_selection(int(dx_var.get()), int(dy_var.get()))
+            except ValueError:
+                messagebox.showerror(APP_TITLE, "Nihe peab olema täisarv.", parent=dlg)
+
+        def resize():
+            try:
+                values = [int(v) for v in sides_var.get().split(",")]
+                entry = table_entry(0, 0, dict(zip(SIDE_NAMES, values)))
+            except (ValueError, KeyError) as exc:
+                messagebox.showerror(APP_TITLE, f"Vigased kohad: {exc}", parent=dlg)
+                return
+            self.resize_selection(entry["sides"])
+
+        def delete():
+            self.delete_selection()
+            if not self.selected_tables:
+                dlg.destroy()
+
+        ttk.Button(dlg, text="Nihuta", command=move).grid(row=1, column=3, padx=12, pady=4)
+        ttk.Button(dlg, text="Muuda suurust", command=resize).grid(row=2, column=3, padx=12, pady=4)
+        ttk.Button(dlg, text="Kustuta", command=delete).grid(row=3, column=3, padx=12, pady=(4, 12))
+
+    def import_tables(self, tables: Dict[int, Dict], replace: bool = False) -> List[str]:
+        errors = []
+        if not replace:
+            errors.extend(f"Laud {n} on juba olemas." for n in sorted(tables.keys() & self.table_layout.keys()))
+        errors.extend(f"Laud {a} kattuks lauaga {b}." for a, b in layout_conflicts(self.table_layout, tables))
+        if errors:
+            return errors
+        self.table_layout.update(tables)
+        self._compiled = None
+        self._rebuild_index()
+        self.save_layout()
+        return []
+
+    def import_tables_dialog(self):
+        if not self._can(PERM_LAYOUT):
+            messagebox.showwarning(APP_TITLE, "Laudade impordi õigus puudub.", parent=self)
+            return
+        dlg = tk.Toplevel(self)
+        dlg.title("Impordi lauad")
+        self._front_dialog(dlg)
+        ttk.Label(dlg, text="Ruudustiku mall, nt '5x4 4 @ 100,100 samm 220,200 nr 101 korrus 2':").pack(anchor="w", padx=12, pady=(12, 4))
+        template_var = tk.StringVar(value="5x4 4 @ 100,100")
+        ttk.Entry(dlg, textvariable=template_var, width=48).pack(fill="x", padx=12)
+        replace_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(dlg, text="Asenda samade numbritega lauad", variable=replace_var).pack(anchor="w", padx=12, pady=6)
+
+        def apply(load: Callable[[], Dict[int, Dict]]):
+            try:
+                tables = load()
+            except (OSError, ValueError) as exc:
+                messagebox.showerror(APP_TITLE, f"Import ebaõnnestus: {exc}", parent=dlg)
+                return
+            errors = self.import_tables(tables, replace_var.get())
+            if errors:
+                more = f"\n... ja veel {len(errors) - 10}" if len(errors) > 10 else ""
+                messagebox.showerror(APP_TITLE, "\n".join(errors[:10]) + more, parent=dlg)
                 return
+            messagebox.showinfo(APP_TITLE, f"Imporditud {len(tables)} lauda.", parent=dlg)
+            dlg.destroy()
+
+        def from_file():
+            file = filedialog.askopenfilename(title="Vali laudade fail", filetypes=[("CSV või JSON", "*.csv *.json"), ("Kõik failid", "*.*")], parent=dlg)
+            if file:
+                path = Path(file)
+                apply(lambda: parse_tables(path.read_text(encoding="utf-8-sig"), "json" if path.suffix.lower() == ".json" else "csv"))
+
+        first = max(self.table_layout, default=0) + 1
+        buttons = ttk.Frame(dlg)
+        buttons.pack(fill="x", padx=12, pady=(0, 12))
+        ttk.Button(buttons, text="Loo ruudustik", command=lambda: apply(lambda: grid_template(template_var.get(), first))).pack(side="left")
+        ttk.Button(buttons, text="Fail (CSV/JSON)...", command=from_file).pack(side="left", padx=6)
 
     def _current_table(self) -> TableData | None:
         if self.selected_table is None:
             messagebox.showwarning(APP_TITLE, "Vali laud kaardilt.", parent=self)
             return None
-        return self.table_data.setdefault(self.selected_table, TableData(self.selected_table))
+        return self.core.table(self.selected_table)
 
     def open_order_window(self):
         table = self._current_table()
@@ -305,20 +1671,18 @@ class RestaurantServiceApp(tk.Tk):
             messagebox.showwarning(APP_TITLE, "Lauale puudub ligipääs.", parent=self)
             return
 
-        owner = self._table_owner(table_num)
-        if owner is None and not self._is_super() and table.has_unpaid() is False:
-            self.table_layout[table_num]["owner"] = self.current_code
-        elif owner is None and self._is_super():
-            self.table_layout[table_num]["owner"] = SUPER_CODE
-
-        if self.order_window and self.order_window.winfo_exists():
-            self.order_window.destroy()
+        if self.order_window_table != table_num:
+            self._close_order_window()
+        if self._core_call(self.core.claim, table_num, self.current_code, self.core.version(table_num), all_tables=self._all_tables()) is None:
+            return
+        self._close_order_window(release=False)
 
         dlg = tk.Toplevel(self)
         dlg.title(f"Tellimused - Laud {table_num}")
         dlg.geometry("700x620")
         self._front_dialog(dlg)
         self.order_window = dlg
+        self.order_window_table = table_num
 
         ttk.Label(dlg, text=f"Laud {table_num}", font=("Segoe UI", 14, "bold")).pack(anchor="w", padx=12, pady=(10, 4))
 
@@ -329,7 +1693,8 @@ class RestaurantServiceApp(tk.Tk):
         ttk.Button(controls, text="Maksa külaline", command=lambda: self.pay_guest_dialog(parent=dlg)).pack(side="left", padx=3)
 
         columns = ("guest", "item", "qty", "unit", "total")
-        tree = ttk.Treeview(dlg, columns=columns, show="headings", height=18)
+        tree = ttk.Treeview(dlg, columns=columns, show="tree headings", height=18)
+        tree.column("#0", width=28, stretch=False)
         for col, title, width in [("guest", "Külaline", 120), ("item", "Toode", 200), ("qty", "Kogus", 70), ("unit", "Ühik", 90), ("total", "Summa", 90)]:
             tree.heading(col, text=title)
             tree.column(col, width=width)
@@ -340,30 +1705,40 @@ class RestaurantServiceApp(tk.Tk):
         output = tk.Text(dlg, height=7)
         output.pack(fill="x", padx=12, pady=(4, 10))
 
+        self._order_view = OrderTreeView(tree)
         self._refresh_order_widgets(tree, total_label)
         self._order_tree = tree
         self._order_total_label = total_label
         self._order_output = output
 
-        def close_order_window():
-            dlg.destroy()
-            self.redraw_map()
+        dlg.protocol("WM_DELETE_WINDOW", self._close_order_window)
 
-        dlg.protocol("WM_DELETE_WINDOW", close_order_window)
+    def _close_order_window(self, release: bool = True):
+        if self.order_window and self.order_window.winfo_exists():
+            self.order_window.destroy()
+        if release and self.order_window_table is not None:
+            self._release_claims([self.order_window_table])
+        self.order_window = None
+        self.order_window_table = None
+        self.request_redraw()
+
+    def _release_claims(self, tables: Iterable[int]):
+        for table_num in sorted(tables):
+            if self.core.state(table_num) == TABLE_CLAIMED and self.core.owner(table_num) == self.current_code:
+                try:
+                    self.core.release(table_num, self.current_code, all_tables=self._all_tables())
+                except CoreError:
+                    pass
 
+    @METRICS.timed("refresh_order_widgets")
     def _refresh_order_widgets(self, tree: ttk.Treeview, total_label: ttk.Label):
         table = self._current_table()
         if not table:
             return
-        for item in tree.get_children():
-            tree.delete(item)
-        for guest, items in table.guests.items():
-            for order in items:
-                tree.insert("", "end", values=(guest, order.name, order.qty, f"{order.unit_price:.2f}", f"{order.total:.2f}"))
+        if self._order_view.tree is not tree:
+            self._order_view = OrderTreeView(tree)
+        self._order_view.sync(table)
         total_label.config(text=f"Laua kogusumma: {table.total():.2f} €")
-        if self.selected_table is not None and not table.has_unpaid():
-            self.table_layout[self.selected_table]["owner"] = None
-        self.redraw_map()
 
     def add_guest_dialog(self, parent: tk.Misc | None = None):
         table = self._current_table()
@@ -371,11 +1746,10 @@ class RestaurantServiceApp(tk.Tk):
             return
         guest = simpledialog.askstring("Külaline", "Sisesta külalise ID (nt K1):", parent=parent or self)
         if guest:
-            if self.selected_table is not None and self._table_owner(self.selected_table) is None and not self._is_super():
-                self.table_layout[self.selected_table]["owner"] = self.current_code
-            table.add_guest(guest.strip())
-            if self.order_window and self.order_window.winfo_exists():
-                self._refresh_order_widgets(self._order_tree, self._order_total_label)
+            if self._core_call(self.core.add_guest, table.table_number, guest.strip(), self.current_code, all_tables=self._all_tables(), parent=parent) is None:
+                return
+            self.request_redraw()
+            self.request_order_refresh()
 
     def add_order_dialog(self, parent: tk.Misc | None = None):
         table = self._current_table()
@@ -387,38 +1761,84 @@ class RestaurantServiceApp(tk.Tk):
 
         dlg = tk.Toplevel(parent or self)
         dlg.title("Lisa tellimus")
-        dlg.geometry("360x240")
+        use_catalog = len(self.catalog) > 0
+        dlg.geometry("380x420" if use_catalog else "360x240")
         self._front_dialog(dlg, parent=parent)
 
         ttk.Label(dlg, text="Külaline").pack(anchor="w", padx=12, pady=(12, 0))
         guest_var = tk.StringVar(value=next(iter(table.guests.keys())))
         ttk.Combobox(dlg, textvariable=guest_var, values=list(table.guests.keys()), state="readonly").pack(fill="x", padx=12)
-        ttk.Label(dlg, text="Toode").pack(anchor="w", padx=12, pady=(10, 0))
+        ttk.Label(dlg, text="Toode" + (" (otsi nime või koodi järgi)" if use_catalog else "")).pack(anchor="w", padx=12, pady=(10, 0))
         item_var = tk.StringVar()
-        ttk.Entry(dlg, textvariable=item_var).pack(fill="x", padx=12)
+        item_entry = ttk.Entry(dlg, textvariable=item_var)
+        item_entry.pack(fill="x", padx=12)
+        item_entry.focus_set()
+        matches: List[MenuItem] = []
+        chosen: List[MenuItem] = []
+        if use_catalog:
+            suggestions = tk.Listbox(dlg, height=8, exportselection=False)
+            suggestions.pack(fill="both", expand=True, padx=12, pady=(4, 0))
+
+            def update_suggestions(*_):
+                matches[:] = self.catalog.search(item_var.get())
+                suggestions.delete(0, "end")
+                for entry in matches:
+                    suggestions.insert("end", f"{entry.name} – {entry.price:.2f} €" + (f" ({entry.category})" if entry.category else ""))
+                if matches:
+                    suggestions.selection_set(0)
+                choose()
+
+            def choose(*_):
+                picked = suggestions.curselection()
+                chosen[:] = [matches[picked[0]]] if picked else []
+                price_var.set(chosen[0].price if chosen else 0.0)
+
+            def step(delta: int):
+                if matches:
+                    picked = suggestions.curselection()
+                    index = min(len(matches) - 1, max(0, (picked[0] if picked else -1) + delta))
+                    suggestions.selection_clear(0, "end")
+                    suggestions.selection_set(index)
+                    suggestions.see(index)
+                    choose()
+                return "break"
+
+            suggestions.bind("<<ListboxSelect>>", choose)
+            item_entry.bind("<Down>", lambda _e: step(1))
+            item_entry.bind("<Up>", lambda _e: step(-1))
+            item_var.trace_add("write", update_suggestions)
         ttk.Label(dlg, text="Kogus").pack(anchor="w", padx=12, pady=(10, 0))
         qty_var = tk.IntVar(value=1)
         ttk.Spinbox(dlg, from_=1, to=99, textvariable=qty_var).pack(fill="x", padx=12)
         ttk.Label(dlg, text="Ühiku hind (€)").pack(anchor="w", padx=12, pady=(10, 0))
         price_var = tk.DoubleVar(value=0.0)
-        ttk.Entry(dlg, textvariable=price_var).pack(fill="x", padx=12)
+        ttk.Entry(dlg, textvariable=price_var, state="readonly" if use_catalog else "normal").pack(fill="x", padx=12)
+        if use_catalog:
+            update_suggestions()
 
         def save():
+            if use_catalog and not chosen:
+                messagebox.showerror(APP_TITLE, "Vali toode menüüst.", parent=dlg)
+                return
             try:
-                new_item = OrderItem(guest_id=guest_var.get(), name=item_var.get().strip(), qty=int(qty_var.get()), unit_price=float(price_var.get()))
-            except ValueError:
+                if chosen:
+                    new_item = OrderItem(guest_var.get(), chosen[0].name, int(qty_var.get()), chosen[0].cents, item_id=chosen[0].item_id)
+                else:
+                    new_item = OrderItem(guest_id=guest_var.get(), name=item_var.get().strip(), qty=int(qty_var.get()), unit_cents=to_cents(price_var.get()))
+            except (ValueError, ArithmeticError, tk.TclError):
                 messagebox.showerror(APP_TITLE, "Kontrolli sisendit.", parent=dlg)
                 return
             if not new_item.name:
                 messagebox.showerror(APP_TITLE, "Toode ei tohi olla tühi.", parent=dlg)
                 return
-            if self.selected_table is not None and self._table_owner(self.selected_table) is None and not self._is_super():
-                self.table_layout[self.selected_table]["owner"] = self.current_code
-            table.add_order(new_item)
+            if self._core_call(self.core.add_order, table.table_number, new_item, self.current_code, all_tables=self._all_tables(), parent=dlg) is None:
+                return
+            self._queue_ticket(table.table_number, new_item)
             dlg.destroy()
-            if self.order_window and self.order_window.winfo_exists():
-                self._refresh_order_widgets(self._order_tree, self._order_total_label)
+            self.request_redraw()
+            self.request_order_refresh()
 
+        item_entry.bind("<Return>", lambda _e: save())
         ttk.Button(dlg, text="Salvesta", command=save).pack(pady=12)
 
     def _build_guest_receipt(self, table: TableData, guest: str) -> str:
@@ -429,11 +1849,16 @@ class RestaurantServiceApp(tk.Tk):
         lines.append(f"Kokku: {table.guest_total(guest):.2f} €")
         return "\n".join(lines)
 
+    def _show_receipt(self, text: str):
+        self._order_output.delete("1.0", tk.END)
+        self._order_output.insert("1.0", text)
+        self._queue_receipt(text)
+
     def pay_guest_dialog(self, parent: tk.Misc | None = None):
         table = self._current_table()
         if not table:
             return
-        payable = [g for g in table.guests if table.guest_total(g) > 0]
+        payable = [g for g in table.guests if table.guest_total_cents(g) > 0]
         if not payable:
             messagebox.showinfo(APP_TITLE, "Tasumata külalisi pole.", parent=parent or self)
             return
@@ -477,21 +1902,21 @@ class RestaurantServiceApp(tk.Tk):
 
         def finish():
             guest = guest_var.get()
-            total = table.guest_total(guest)
+            total = table.guest_total_cents(guest)
             receipt_text = self._build_guest_receipt(table, guest)
             if method_var.get() == "cash":
                 try:
-                    paid = float(cash_var.get())
-                except ValueError:
+                    paid = to_cents(cash_var.get().strip())
+                except ArithmeticError:
                     messagebox.showerror(APP_TITLE, "Sisesta korrektne sularaha summa.", parent=dlg)
                     return
                 if paid < total:
                     messagebox.showerror(APP_TITLE, "Sularaha summa on väiksem kui arve.", parent=dlg)
                     return
                 change = paid - total
-                table.mark_guest_paid(guest)
-                self._order_output.delete("1.0", tk.END)
-                self._order_output.insert("1.0", f"{receipt_text}\n\nMakse: sularaha\nSaadud: {paid:.2f} €\nTagastus: {change:.2f} €")
+                if self._complete_payment(table, guest, "cash", dlg) is None:
+                    return
+                self._show_receipt(f"{receipt_text}\n\nMakse: sularaha\nSaadud: {paid / 100:.2f} €\nTagastus: {change / 100:.2f} €")
                 dlg.destroy()
             else:
                 card = tk.Toplevel(dlg)
@@ -501,19 +1926,19 @@ class RestaurantServiceApp(tk.Tk):
                 ttk.Label(card, text="Sisesta kaart...", font=("Segoe UI", 12, "bold")).pack(pady=(20, 10))
 
                 def done():
-                    table.mark_guest_paid(guest)
-                    self._order_output.delete("1.0", tk.END)
-                    self._order_output.insert("1.0", f"{receipt_text}\n\nMakse: kaart\nStaatus: Tasutud")
+                    if self._complete_payment(table, guest, "card", card) is None:
+                        return
+                    self._show_receipt(f"{receipt_text}\n\nMakse: kaart\nStaatus: Tasutud")
                     card.destroy()
                     dlg.destroy()
-                    if self.order_window and self.order_window.winfo_exists():
-                        self._refresh_order_widgets(self._order_tree, self._order_total_label)
+                    self.request_redraw()
+                    self.request_order_refresh()
 
                 ttk.Button(card, text="Makse tehtud", command=done).pack(pady=6)
                 return
 
-            if self.order_window and self.order_window.winfo_exists():
-                self._refresh_order_widgets(self._order_tree, self._order_total_label)
+            self.request_redraw()
+            self.request_order_refresh()
 
         ttk.Button(dlg, text="Kinnita makse", command=finish).pack(pady=(4, 12))
 
@@ -522,35 +1947,172 @@ class RestaurantServiceApp(tk.Tk):
         on_method()
         refresh_receipt()
 
-    def save_layout(self):
-        self.layout_file.write_text(json.dumps({"tables": self.table_layout}, indent=2), encoding="utf-8")
+    @METRICS.timed("save_layout")
+    def save_layout(self, notify: bool = False):
+        self.persistence.submit(self.layout_file, {"tables": dict(self.table_layout)}, notify)
+        self._compile_layout_cache(self.layout_file)
+
+    def _compile_layout_cache(self, path: Path):
+        self.persistence.submit(layout_cache_path(path), lambda: compile_layout(path))
+
+    @METRICS.timed("payment")
+    def _complete_payment(self, table: TableData, guest: str, method: str, parent: tk.Misc) -> int | None:
+        return self._core_call(self.core.pay_guest, table.table_number, guest, method, self.current_code, all_tables=self._all_tables(), parent=parent)
+
+    def open_diagnostics_window(self):
+        if not self._can(PERM_DIAGNOSTICS):
+            messagebox.showwarning(APP_TITLE, "Diagnostika vaatamise õigus puudub.", parent=self)
+            return
+        dlg = tk.Toplevel(self)
+        dlg.title("Diagnostika")
+        dlg.geometry("640x480")
+        self._front_dialog(dlg)
+
+        enabled_var = tk.BooleanVar(value=METRICS.enabled)
+        controls = ttk.Frame(dlg)
+        controls.pack(fill="x", padx=12, pady=(10, 4))
+
+        columns = ("count", "p50", "p95", "p99", "max")
+        tree = ttk.Treeview(dlg, columns=columns, show="tree headings", height=10)
+        tree.heading("#0", text="Operatsioon")
+        tree.column("#0", width=180)
+        for col, title in zip(columns, ("Arv", "p50 ms", "p95 ms", "p99 ms", "max ms")):
+            tree.heading(col, text=title)
+            tree.column(col, width=80, anchor="e")
+        tree.pack(fill="both", expand=True, padx=12, pady=4)
+        details = tk.Text(dlg, height=8)
+        details.pack(fill="x", padx=12, pady=(4, 10))
+
+        def refresh():
+            if METRICS.enabled:
+                METRICS.gauge("canvas_items", self.map_renderer.item_count())
+            snapshot = METRICS.snapshot()
+            tree.delete(*tree.get_children())
+            for name, stats in snapshot["operations"].items():
+                tree.insert("", "end", text=name, values=(stats["count"], f"{stats['p50_ms']:.2f}", f"{stats['p95_ms']:.2f}", f"{stats['p99_ms']:.2f}", f"{stats['max_ms']:.2f}"))
+            details.delete("1.0", tk.END)
+            details.insert("1.0", json.dumps({"gauges": snapshot["gauges"], **snapshot["sources"]}, indent=2))
+
+        def toggle():
+            METRICS.enabled = enabled_var.get()
+            refresh()
+
+        def reset():
+            METRICS.reset()
+            refresh()
+
+        def export():
+            file = filedialog.asksaveasfilename(parent=dlg, title="Ekspordi mõõtmised", defaultextension=".json", filetypes=[("JSON", "*.json")])
+            if file:
+                try:
+                    METRICS.export(Path(file))
+                except OSError as exc:
+                    messagebox.showerror(APP_TITLE, f"Mõõtmiste salvestamine ebaõnnestus: {exc}", parent=dlg)
+
+        ttk.Checkbutton(controls, text="Mõõtmine sees", variable=enabled_var, command=toggle).pack(side="left", padx=3)
+        ttk.Button(controls, text="Värskenda", command=refresh).pack(side="left", padx=3)
+        ttk.Button(controls, text="Lähtesta", command=reset).pack(side="left", padx=3)
+        ttk.Button(controls, text="Ekspordi JSON", command=export).pack(side="left", padx=3)
+        refresh()
+
+    @METRICS.timed("sales_report")
+    def _sales_report(self, period: str, parent: tk.Misc) -> Dict | None:
+        return self._core_call(self.core.sales_report, *period_bounds(period), parent=parent)
+
+    def open_report_window(self):
+        if not self._can(PERM_REPORTS):
+            messagebox.showwarning(APP_TITLE, "Aruande vaatamise õigus puudub.", parent=self)
+            return
+        dlg = tk.Toplevel(self)
+        dlg.title("Müügiaruanne")
+        dlg.geometry("560x480")
+        self._front_dialog(dlg)
+
+        period_var = tk.StringVar(value=next(iter(REPORT_PERIODS)))
+        titles = {title: dimension for dimension, title in DIMENSION_TITLES.items()}
+        group_var = tk.StringVar(value=DIMENSION_TITLES[DIMENSIONS[0]])
+        report: Dict = {}
+        controls = ttk.Frame(dlg)
+        controls.pack(fill="x", padx=12, pady=(10, 4))
+        ttk.Label(controls, text="Periood:").pack(side="left")
+        period_box = ttk.Combobox(controls, textvariable=period_var, values=list(REPORT_PERIODS), state="readonly", width=10)
+        period_box.pack(side="left", padx=(3, 10))
+        ttk.Label(controls, text="Rühm:").pack(side="left")
+        group_box = ttk.Combobox(controls, textvariable=group_var, values=list(titles), state="readonly", width=12)
+        group_box.pack(side="left", padx=3)
+
+        columns = ("qty", "sum", "share")
+        tree = ttk.Treeview(dlg, columns=columns, show="tree headings", height=14)
+        tree.heading("#0", text=group_var.get())
+        tree.column("#0", width=200)
+        for col, title in zip(columns, ("Kogus", "Summa €", "Osa %")):
+            tree.heading(col, text=title)
+            tree.column(col, width=90, anchor="e")
+        tree.pack(fill="both", expand=True, padx=12, pady=4)
+        total_label = ttk.Label(dlg, text="")
+        total_label.pack(anchor="w", padx=12, pady=(0, 4))
+
+        def show(*_):
+            tree.heading("#0", text=group_var.get())
+            tree.delete(*tree.get_children())
+            total = report.get("cents", 0)
+            for label, qty, cents in report.get("groups", {}).get(titles[group_var.get()], []):
+                tree.insert("", "end", text=label, values=(qty, f"{cents / 100:.2f}", f"{cents * 100 / total:.1f}" if total else "0.0"))
+            total_label.config(text=f"Ridu: {report.get('lines', 0)} · kogus: {report.get('qty', 0)} · kokku: {total / 100:.2f} €")
+
+        def refresh(*_):
+            result = self._sales_report(period_var.get(), dlg)
+            if result is not None:
+                report.clear()
+                report.update(result)
+                show()
+
+        def export():
+            if not report:
+                return
+            file = filedialog.asksaveasfilename(parent=dlg, title="Ekspordi aruanne", defaultextension=".csv", filetypes=[("CSV", "*.csv")])
+            if file:
+                try:
+                    export_csv(report, Path(file))
+                except OSError as exc:
+                    messagebox.showerror(APP_TITLE, f"Aruande salvestamine ebaõnnestus: {exc}", parent=dlg)
+
+        period_box.bind("<<ComboboxSelected>>", refresh)
+        group_box.bind("<<ComboboxSelected>>", show)
+        ttk.Button(controls, text="Värskenda", command=refresh).pack(side="left", padx=3)
+        ttk.Button(controls, text="Ekspordi CSV", command=export).pack(side="left", padx=3)
+        refresh()
 
     def save_layout_dialog(self):
         file = filedialog.asksaveasfilename(title="Salvesta kaardi fail", defaultextension=".json", filetypes=[("JSON", "*.json")])
         if not file:
             return
         self.layout_file = Path(file)
-        self.save_layout()
-        messagebox.showinfo(APP_TITLE, "Kaart salvestatud.", parent=self)
+        self.save_layout(notify=True)
+        self.map_hint_label.config(text=f"Kaarti salvestatakse faili {self.layout_file.name}…")
 
+    @METRICS.timed("load_layout")
     def load_layout(self, path: Path):
-        if path.exists():
+        self._compiled = CompiledLayout.open(path) if path.exists() else None
+        if self._compiled is not None:
+            self.table_layout = self._compiled.entries()
+            if self._compiled.stale:
+                self._compile_layout_cache(path)
+        elif path.exists():
             try:
-                data = json.loads(path.read_text(encoding="utf-8"))
-                raw = data.get("tables", {})
-                self.table_layout = {int(k): v for k, v in raw.items()}
+                self.table_layout = parse_layout(path.read_bytes())
+                self._compile_layout_cache(path)
             except Exception as exc:
                 messagebox.showwarning(APP_TITLE, f"Kaardi laadimine ebaõnnestus: {exc}", parent=self)
                 self.table_layout = {}
         else:
             self.table_layout = {
-                1: {"center": {"x": 100, "y": 100}, "sides": {"up": 2, "right": 2, "down": 2, "left": 2}, "owner": None},
-                2: {"center": {"x": 280, "y": 140}, "sides": {"up": 1, "right": 3, "down": 1, "left": 3}, "owner": None},
+                1: {"center": {"x": 100, "y": 100}, "sides": {"up": 2, "right": 2, "down": 2, "left": 2}},
+                2: {"center": {"x": 280, "y": 140}, "sides": {"up": 1, "right": 3, "down": 1, "left": 3}},
             }
-        for number in self.table_layout:
-            self.table_data.setdefault(number, TableData(number))
-            self.table_layout[number].setdefault("owner", None)
-        self.redraw_map()
+        self._rebuild_index()
+        self.map_renderer.set_layout(self.table_layout)
+        self.request_redraw()
 
     def load_layout_dialog(self):
         file = filedialog.askopenfilename(title="Vali kaardi fail", filetypes=[("JSON", "*.json")])
@@ -561,6 +2123,14 @@ class RestaurantServiceApp(tk.Tk):
         messagebox.showinfo(APP_TITLE, "Kaart laetud.", parent=self)
 
 
-if __name__ == "__main__":
-    app = RestaurantServiceApp()
+def main():
+    parser = argparse.ArgumentParser(description=APP_TITLE)
+    parser.add_argument("--connect", help="keskserveri aadress (host:port või unix:/tee/pesa)")
+    args = parser.parse_args()
+    core = CoreClient(args.connect) if args.connect else None
+    app = RestaurantServiceApp(core)
     app.mainloop()
+
+
+if __name__ == "__main__":
+    main()